@@ -0,0 +1,262 @@
+import functools
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Callable
+
+import requests
+import supervisely as sly
+
+HIGH_PRIORITY = 0
+LOW_PRIORITY = 1
+
+# Share of the bucket that only high priority (user-facing) calls may consume.
+HIGH_PRIORITY_RESERVE = 0.25
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_local = threading.local()
+
+
+def get_priority() -> int:
+    return getattr(_local, "priority", HIGH_PRIORITY)
+
+
+@contextmanager
+def api_priority(priority: int):
+    """Run the API calls made by the current thread with the given priority."""
+    previous = get_priority()
+    _local.priority = priority
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def low_priority(fn: Callable) -> Callable:
+    """Wrap a function run by background worker threads, so its API calls yield to
+    user-facing calls. Worker threads don't inherit the priority of their caller."""
+
+    @functools.wraps(fn)
+    def wrapped(*args, **kwargs):
+        with api_priority(LOW_PRIORITY):
+            return fn(*args, **kwargs)
+
+    return wrapped
+
+
+class TokenBucket:
+    """Token bucket rate limiter with a reserve for high priority callers."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._high_waiting = 0
+        self._condition = threading.Condition()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+    def acquire(self, priority: int = HIGH_PRIORITY) -> None:
+        reserve = self.capacity * HIGH_PRIORITY_RESERVE
+        with self._condition:
+            if priority == HIGH_PRIORITY:
+                self._high_waiting += 1
+            try:
+                while True:
+                    self._refill()
+                    if priority == HIGH_PRIORITY:
+                        available = self._tokens >= 1
+                    else:
+                        available = (
+                            not self._high_waiting and self._tokens >= 1 + reserve
+                        )
+                    if available:
+                        self._tokens -= 1
+                        return
+                    missing = 1 + (0 if priority == HIGH_PRIORITY else reserve)
+                    wait = max((missing - self._tokens) / self.rate, 0.01)
+                    self._condition.wait(wait)
+            finally:
+                if priority == HIGH_PRIORITY:
+                    self._high_waiting -= 1
+                    self._condition.notify_all()
+
+
+class RetryBudget:
+    """Global retry budget: every successful call deposits a fraction of a retry,
+    every retry withdraws one, so retries can't amplify an outage."""
+
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(
+        error,
+        (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout,
+            requests.exceptions.RetryError,
+        ),
+    ):
+        return True
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return error.response.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+
+class ApiWrapper(ABC):
+    """Base for layers over sly.Api: every API method call, including the ones of
+    sub-APIs (e.g. `api.project.get_info_by_id`), goes through `call` together
+    with its dotted path."""
+
+    def __init__(self, api: sly.Api):
+        self._api = api
+
+    @abstractmethod
+    def call(self, path: str, method: Callable, *args, **kwargs) -> Any:
+        pass
+
+    def __getattr__(self, name: str) -> Any:
+        return _wrap(self, getattr(self._api, name), name)
+
+
+class ApiClient:
+    """Shared client layer over the HTTP requests of sly.Api used by the monitoring
+    loop, the copy path and the UI callbacks.
+
+    Every request the SDK sends (`Api.post` and `Api.get`, so a paginated SDK method
+    makes several) goes through a token bucket rate limiter and takes a slot from a
+    fixed size pool of concurrent requests. Retryable errors are retried here with
+    exponential backoff while the global retry budget allows it, the SDK's own retries
+    are disabled so they don't stack. Requests made inside `api_priority(LOW_PRIORITY)`
+    (monitoring polls and background workers) yield to user-facing requests.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        pool_size: int,
+        max_retries: int,
+        retry_budget_ratio: float,
+        backoff: float = 0.5,
+    ):
+        self._bucket = TokenBucket(rate, burst)
+        self._pool = threading.BoundedSemaphore(pool_size)
+        self._retry_budget = RetryBudget(retry_budget_ratio, max_tokens=burst)
+        self._max_retries = max_retries
+        self._backoff = backoff
+
+    def install(self, api: sly.Api) -> sly.Api:
+        """Send the HTTP requests of the api through the client."""
+        send_post = api.post
+        send_get = api.get
+        api.retry_count = 1
+        api.retry_sleep_sec = 0
+
+        def post(method, data, retries=None, stream=False, raise_error=True):
+            return self.request(
+                f"POST {method}",
+                send_post,
+                method,
+                data,
+                retries=1,
+                stream=stream,
+                raise_error=raise_error,
+            )
+
+        def get(
+            method, params, retries=None, stream=False, use_public_api=True, data=None
+        ):
+            return self.request(
+                f"GET {method}",
+                send_get,
+                method,
+                params,
+                retries=1,
+                stream=stream,
+                use_public_api=use_public_api,
+                data=data,
+            )
+
+        api.post = post
+        api.get = get
+        return api
+
+    def request(self, name: str, send: Callable, *args, **kwargs) -> Any:
+        attempt = 0
+        while True:
+            self._bucket.acquire(get_priority())
+            try:
+                with self._pool:
+                    response = send(*args, **kwargs)
+                if response is None:
+                    # Api.get returns nothing when its only attempt fails.
+                    raise requests.exceptions.RetryError(f"{name} failed")
+            except Exception as e:
+                if (
+                    attempt >= self._max_retries
+                    or not is_retryable(e)
+                    or not self._retry_budget.withdraw()
+                ):
+                    raise
+                delay = self._backoff * 2**attempt
+                attempt += 1
+                sly.logger.warning(
+                    f"API request {name} failed: {e}. "
+                    f"Retry {attempt}/{self._max_retries} in {delay:.1f}s"
+                )
+                time.sleep(delay)
+                continue
+            self._retry_budget.deposit()
+            return response
+
+
+class _ApiProxy:
+    """Wraps a sub-API (e.g. `api.project`) so its methods go through the wrapper."""
+
+    def __init__(self, wrapper: ApiWrapper, target: Any, path: str):
+        self._wrapper = wrapper
+        self._target = target
+        self._path = path
+
+    def __getattr__(self, name: str) -> Any:
+        return _wrap(self._wrapper, getattr(self._target, name), f"{self._path}.{name}")
+
+
+def _wrap(wrapper: ApiWrapper, value: Any, path: str) -> Any:
+    if callable(value):
+
+        def wrapped(*args, **kwargs):
+            return wrapper.call(path, value, *args, **kwargs)
+
+        wrapped.__name__ = getattr(value, "__name__", "wrapped")
+        wrapped.__doc__ = getattr(value, "__doc__", None)
+        return wrapped
+    if value is None or isinstance(
+        value, (str, bytes, int, float, bool, dict, list, tuple)
+    ):
+        return value
+    return _ApiProxy(wrapper, value, path)
@@ -6,7 +6,6 @@ from supervisely.app.widgets import (
     SelectClass,
     SelectTag,
     Container,
-    Widget,
     Card,
     Button,
     Text,
@@ -18,13 +17,71 @@ from supervisely.app.widgets import (
     Modal,
     ActivityFeed,
     Checkbox,
+    Input,
+    Progress,
 )
 import src.globals as g
-from typing import Optional, Dict, Any, List, Tuple
+from src.api_client import LOW_PRIORITY, api_priority, low_priority
+from src.custom_data import (
+    MULTITEAM_LABELING_WORKFLOW_STATE_TITLE,
+    MULTITEAM_LABELING_WORKFLOW_TITLE,
+    get_workflow_state,
+    update_project_custom_data,
+    update_workflow_state,
+    update_workflow_states,
+)
+from src.delta import (
+    DeltaSource,
+    get_snapshot_path,
+    submit_snapshot,
+    submit_workflow_deltas,
+)
+from src.dependencies import get_parallel_stages
+from src.leases import LeaseManager
+from src.merge import MergeSource, merge_stage_datasets
+from src.preflight import TeamMembers, run_preflight
+from src.quality_check import (
+    NO_QUALITY_CHECK_QUEUE_KIND,
+    escalate_step,
+    get_image_strata,
+    get_sample_fraction,
+    load_escalated_teams,
+    observe_rejections,
+    sample_image_ids,
+)
+from src.rebalancer import rebalance_step, return_auxiliary_items
+from src.reclaim import (
+    ReclaimPlan,
+    get_step_project_lock,
+    plan_reclaim,
+    reclaim_step_datasets,
+)
+from src.state import (
+    DatasetState,
+    QualityCheckStats,
+    QueueState,
+    StepConfig,
+    StepPoll,
+    StepState,
+    WorkflowState,
+    get_configs_meta,
+)
+from src.tracing import PollProfiler, traced
+from src.utils import (
+    AUXILIARY_QUEUE_SEPARATOR,
+    get_step_fingerprint,
+    is_auxiliary_queue_name,
+)
+from src.write_back import write_back_annotations
+from typing import Optional, Dict, Any, List, Set, Tuple
 from supervisely.app.singleton import Singleton
-from supervisely.api.user_api import UserInfo
 from supervisely.api.labeling_queue_api import LabelingQueueInfo
-from time import sleep
+from time import sleep, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fnmatch import fnmatch
+from collections import defaultdict
+from abc import ABC, ABCMeta, abstractmethod
+import os
 import threading
 
 
@@ -43,21 +100,156 @@ class WorkflowSettings(metaclass=Singleton):
         return None
 
 
-MULTITEAM_LABELING_WORKFLOW_TITLE = "multi_team_labeling_workflow"
 MULTITEAM_LABELING_WORKFLOW_MARKER = "MTLWQ"
 WAIT_TIME = 5  # seconds
 MONITORING_INTERVAL = 10  # seconds between checks
+WRITE_BACK_DONE = "done"
+PROVISION_WORKERS = 4
+BULK_LAUNCH_WORKERS = 4
+DISCOVERY_INTERVAL = 6  # polls between looking for workflows launched elsewhere
+LAUNCH_HELD = "held"
+LAUNCH_CLAIMING = "claiming"
 
 RESET_ICON = "zmdi zmdi-close"
 UPDATE_ICON = "zmdi zmdi-refresh"
 
 
+def is_reclaim_pending(workflow_state: Dict[str, Any]) -> bool:
+    """Return True if the step datasets of a finalized workflow are still to be
+    reclaimed (or, in a dry run, listed)."""
+    if not g.RECLAIM_STEP_DATASETS or workflow_state.get("reclaimed"):
+        return False
+    return not (g.RECLAIM_DRY_RUN and "reclaimable" in workflow_state)
+
+
 class WorkflowMonitor(metaclass=Singleton):
     """Manages background monitoring of workflow status."""
 
     def __init__(self):
         self.active = False
         self.thread = None
+        self.monitor_selected = False
+        self.workflows: Dict[int, BaseWorkflow] = {}
+        # Datasets whose workflows are being launched, skipped by discovery.
+        self.launching: Set[int] = set()
+
+    def register(self, workflow: "BaseWorkflow") -> None:
+        """Monitor a headless workflow in addition to the one selected in the UI."""
+        self.workflows[workflow.dataset_id] = workflow
+
+    def update_all(self) -> None:
+        """Update the selected workflow (while the overview is open) and all
+        registered headless workflows. The selected dataset is displayed.
+
+        Only workflows whose lease is held by this instance are processed.
+        """
+        selected_workflow = Workflow()
+        selected_dataset_id = selected_workflow.dataset_id
+        if (
+            self.monitor_selected
+            and selected_dataset_id not in self.workflows
+            and self.hold(selected_workflow)
+        ):
+            was_finalized = selected_workflow.state.finalized
+            try:
+                update_workflow_status()
+                if (
+                    g.RECLAIM_STEP_DATASETS
+                    and selected_workflow.state.finalized
+                    and not was_finalized
+                ):
+                    self.reclaim([selected_workflow])
+            except Exception as e:
+                sly.logger.error(
+                    f"Error updating workflow for Dataset ID {selected_dataset_id}: {e}",
+                    exc_info=True,
+                )
+
+        finalized_now = []
+        for dataset_id, workflow in list(self.workflows.items()):
+            if not self.hold(workflow):
+                continue
+            was_finalized = workflow.state.finalized
+            try:
+                update_workflow_status(
+                    workflow, display=dataset_id == selected_dataset_id
+                )
+            except Exception as e:
+                sly.logger.error(
+                    f"Error updating workflow for Dataset ID {dataset_id}: {e}",
+                    exc_info=True,
+                )
+            if workflow.state.finalized and not was_finalized:
+                finalized_now.append(workflow)
+
+        # Leases are kept until the datasets of the finished workflows are reclaimed.
+        if g.RECLAIM_STEP_DATASETS and finalized_now:
+            self.reclaim(finalized_now)
+        for workflow in finalized_now:
+            LeaseManager().release(workflow.project_id, workflow.dataset_id)
+
+    @staticmethod
+    def reclaim(workflows: List["BaseWorkflow"]) -> None:
+        """Remove intermediate step datasets of finished workflows in one bulk."""
+        try:
+            reclaim_step_datasets(
+                [workflow.get_reclaim_plan() for workflow in workflows],
+                dry_run=g.RECLAIM_DRY_RUN,
+            )
+        except Exception as e:
+            sly.logger.error(f"Failed to reclaim step datasets: {e}")
+            return
+        if not g.RECLAIM_DRY_RUN:
+            for workflow in workflows:
+                workflow.state.reclaimed = True
+
+    @staticmethod
+    def hold(workflow: "BaseWorkflow") -> bool:
+        """Return True if the workflow can be processed by this instance. Finalized
+        workflows don't need a lease, there is nothing left to orchestrate."""
+        if not workflow.project_id or not workflow.dataset_id:
+            return False
+        if workflow.state.finalized:
+            return True
+        return LeaseManager().hold(workflow.project_id, workflow.dataset_id)
+
+    def discover_workflows(self) -> None:
+        """Register launched, not finalized workflows saved in the custom data of the
+        known projects, so this instance can take them over when their owner stops.
+
+        Finalized workflows whose step datasets were not reclaimed, e.g. because the
+        instance stopped right after finalizing them, are registered as well: their
+        next poll finds all steps completed and reclaims the datasets.
+        """
+        project_ids = {g.PROJECT_ID, Workflow().project_id}
+        project_ids.update(workflow.project_id for workflow in self.workflows.values())
+        for project_id in filter(None, project_ids):
+            project_custom_data = g.api.project.get_custom_data(project_id)
+            load_escalated_teams(project_custom_data)
+            configs = project_custom_data.get(MULTITEAM_LABELING_WORKFLOW_TITLE, {})
+            states = project_custom_data.get(
+                MULTITEAM_LABELING_WORKFLOW_STATE_TITLE, {}
+            )
+            project_info = None
+            for dataset_id, state in states.items():
+                if (
+                    not state.get("launched")
+                    or (state.get("finalized") and not is_reclaim_pending(state))
+                    or int(dataset_id) in self.workflows
+                    or int(dataset_id) in self.launching
+                    or dataset_id not in configs
+                ):
+                    continue
+                project_info = project_info or g.api.project.get_info_by_id(project_id)
+                dataset_info = g.api.dataset.get_info_by_id(int(dataset_id))
+                if dataset_info is None:
+                    continue
+                sly.logger.info(f"Discovered workflow of Dataset ID {dataset_id}.")
+                workflow = HeadlessWorkflow(
+                    project_info, dataset_info, configs[dataset_id]
+                )
+                workflow.load_quality_check_stats(state)
+                self.register(workflow)
 
     def start(self):
         """Start the monitoring loop."""
@@ -65,7 +257,11 @@ class WorkflowMonitor(metaclass=Singleton):
             self.stop()
 
         sly.logger.info("Starting workflow monitoring")
-        update_workflow_status()
+        # The first poll after start fetches and displays every step.
+        Workflow().state.reset_polls()
+        for workflow in self.workflows.values():
+            workflow.state.reset_polls()
+        self.update_all()
 
         self.active = True
         self.thread = threading.Thread(target=self._monitoring_loop, daemon=True)
@@ -80,14 +276,22 @@ class WorkflowMonitor(metaclass=Singleton):
         self.active = False
         if self.thread and self.thread.is_alive():
             self.thread.join(timeout=2)
+        # Let other instances take the workflows over right away.
+        LeaseManager().release_all()
         sly.logger.info("Workflow monitoring stopped")
 
     def _monitoring_loop(self):
         """Background loop that periodically updates workflow status."""
+        polls = 0
         while self.active:
             try:
-                update_workflow_status()
-                sly.logger.debug(f"Status updated, waiting {MONITORING_INTERVAL}s")
+                if polls % DISCOVERY_INTERVAL == 0:
+                    self.discover_workflows()
+                polls += 1
+                # Polls yield to the API calls of user-facing actions.
+                with api_priority(LOW_PRIORITY), PollProfiler().poll():
+                    self.update_all()
+                sly.logger.debug("Status updated, waiting %ss", MONITORING_INTERVAL)
 
                 # Sleep in small increments to allow quick stop
                 for _ in range(MONITORING_INTERVAL):
@@ -171,6 +375,25 @@ launch_workflow_button = Button(
 )
 launch_workflow_button.disable()
 
+bulk_filter_input = Input(placeholder="All datasets, or a name pattern, e.g. train_*")
+bulk_launch_button = Button(
+    "Launch for Datasets",
+    button_type="success",
+    plain=True,
+    icon="zmdi zmdi-collection-item",
+    icon_gap=10,
+)
+bulk_progress = Progress(hide_on_finish=False)
+bulk_field = Field(
+    Container(widgets=[bulk_filter_input, bulk_launch_button, bulk_progress]),
+    title="Bulk Launch",
+    description="Apply the configured steps to every dataset of the project matching "
+    "the pattern and launch their workflows.",
+)
+
+preflight_text = Text("")
+preflight_text.hide()
+
 buttons_flexbox = Flexbox(
     widgets=[reset_workflow_button, save_workflow_button, launch_workflow_button],
     gap=0,
@@ -186,6 +409,8 @@ settings_card = Card(
             require_classes_checkbox,
             require_tags_checkbox,
             require_quality_checkbox,
+            preflight_text,
+            bulk_field,
             workflow_modal,
         ]
     ),
@@ -216,7 +441,15 @@ def get_existing_workflow_config(project_id: int) -> Dict[int, Dict[str, Any]]:
     return existing_workflow_config
 
 
+@traced(
+    "process_workflow_step",
+    lambda workflow, step_number, *args: {
+        "dataset_id": workflow.dataset_id,
+        "step": step_number,
+    },
+)
 def process_workflow_step(
+    workflow: "BaseWorkflow",
     step_number: int,
     step_dataset_info: Optional[sly.DatasetInfo],
     step_labeling_queue_info: Optional[LabelingQueueInfo],
@@ -227,36 +460,71 @@ def process_workflow_step(
     Returns:
         Tuple of (item_status, updated_queue_info, new_move_forward_flag)
     """
-    sly.logger.info(
-        f"Step {step_number} - Dataset: {step_dataset_info.id if step_dataset_info else 'N/A'}, "
-        f"Queue: {step_labeling_queue_info.name if step_labeling_queue_info else 'N/A'}, "
-        f"Move forward: {move_forward_needed}"
+    sly.logger.debug(
+        "Step %s - Dataset: %s, Queue: %s, Move forward: %s",
+        step_number,
+        step_dataset_info.id if step_dataset_info else "N/A",
+        step_labeling_queue_info.name if step_labeling_queue_info else "N/A",
+        move_forward_needed,
     )
 
     # Handle existing labeling queue
     if step_labeling_queue_info:
-        return handle_existing_queue(step_number, step_labeling_queue_info)
+        return handle_existing_queue(workflow, step_number, step_labeling_queue_info)
 
     # Handle missing labeling queue
-    return handle_missing_queue(step_number, step_dataset_info, move_forward_needed)
+    return handle_missing_queue(
+        workflow, step_number, step_dataset_info, move_forward_needed
+    )
 
 
 def handle_existing_queue(
-    step_number: int, queue_info: LabelingQueueInfo
+    workflow: "BaseWorkflow", step_number: int, queue_info: LabelingQueueInfo
 ) -> Tuple[str, LabelingQueueInfo, bool]:
     """Handle a step that already has a labeling queue."""
     queue_status = queue_info.status
-    sly.logger.info(f"Step {step_number} queue status: {queue_status}")
+    sly.logger.debug("Step %s queue status: %s", step_number, queue_status)
 
+    workflow_step = workflow.steps[step_number]
     if queue_status == "completed":
-        sly.logger.info(f"Step {step_number} completed - ready to move forward")
-        return "completed", queue_info, True
+        # Unchecked items left by the main queue still get the escalated check.
+        if escalate_step(workflow_step):
+            update_workflow_state(
+                workflow.project_id,
+                workflow.dataset_id,
+                {"quality_check": workflow.get_quality_check_stats()},
+            )
+        pending_queues = [
+            aux_queue
+            for aux_queue in workflow_step.get_auxiliary_queues()
+            if aux_queue.status != "completed"
+        ]
+        if not pending_queues:
+            return_auxiliary_items(workflow_step)
+            sly.logger.info(f"Step {step_number} completed - ready to move forward")
+            return "completed", queue_info, True
+        sly.logger.info(
+            f"Step {step_number} main queue completed, waiting for "
+            f"{len(pending_queues)} auxiliary queue(s)"
+        )
+        return "in_progress", queue_info, False
     else:
-        sly.logger.info(f"Step {step_number} in progress - waiting")
+        sly.logger.debug("Step %s in progress - waiting", step_number)
+        rejections_changed = observe_rejections(
+            workflow.project_id, workflow_step.state, queue_info
+        )
+        if escalate_step(workflow_step) or rejections_changed:
+            update_workflow_state(
+                workflow.project_id,
+                workflow.dataset_id,
+                {"quality_check": workflow.get_quality_check_stats()},
+            )
+        rebalance_step(workflow_step, queue_info)
         return "in_progress", queue_info, False
 
 
 def handle_missing_queue(
+    workflow: "BaseWorkflow",
     step_number: int,
     dataset_info: Optional[sly.DatasetInfo],
     move_forward_needed: bool,
@@ -264,8 +532,11 @@ def handle_missing_queue(
     """Handle a step that doesn't have a labeling queue yet."""
     # First step with existing dataset
     if dataset_info and step_number == 1:
+        if not workflow.snapshot_source():
+            sly.logger.debug("Step 1 waits for the source annotations to be saved")
+            return "pending", None, False
         sly.logger.info(f"Step {step_number} - creating initial queue")
-        queue_info = Workflow().steps[step_number].create_labeling_queue()
+        queue_info = workflow.steps[step_number].create_labeling_queue()
         if queue_info:
             sly.logger.info(f"Step {step_number} - queue created successfully")
             return "in_progress", queue_info, False
@@ -274,7 +545,7 @@ def handle_missing_queue(
     # Subsequent steps waiting for previous completion
     if move_forward_needed:
         sly.logger.info(f"Step {step_number} - moving forward from previous step")
-        queue_info = Workflow().steps[step_number].move_forward()
+        queue_info = workflow.steps[step_number].move_forward()
         if queue_info:
             sly.logger.info(f"Step {step_number} - moved forward successfully")
             return "in_progress", queue_info, False
@@ -305,35 +576,163 @@ def update_step_display(
     activity_feed.set_status(number=step_number, status=item_status)
 
 
-def update_workflow_status():
-    """Update workflow status for all steps."""
-    move_forward_needed = False
+@traced(
+    "update_workflow_status",
+    lambda workflow=None, display=True: {
+        "dataset_id": workflow.dataset_id if workflow else Workflow().dataset_id
+    },
+)
+def update_workflow_status(
+    workflow: Optional["BaseWorkflow"] = None, display: bool = True
+):
+    """Update workflow status for all steps.
+
+    Steps of a stage move forward together when all steps of the previous stage
+    are completed, after their annotations are merged.
 
-    for step_number, (dataset_info, queue_info) in enumerate(
-        Workflow().all_steps_queues(), start=1
-    ):
-        item_status, updated_queue_info, move_forward_needed = process_workflow_step(
-            step_number, dataset_info, queue_info, move_forward_needed
-        )
+    Only active steps are fetched: completed steps and pending steps after the
+    first one that can't move forward yet are taken from the last poll. A fetched step is processed
+    and displayed only if its fingerprint changed since the last poll.
+    """
+    workflow = workflow or Workflow()
+    if workflow.state.reclaimed:
+        # Step datasets are removed, there is nothing left to poll.
+        if display:
+            for step_number in workflow.steps:
+                status_texts[step_number].text = "Finished, step dataset removed"
+                activity_feed.set_status(number=step_number, status="completed")
+        return
 
-        update_step_display(
-            step_number, dataset_info, updated_queue_info or queue_info, item_status
+    stages = workflow.get_stages()
+    statuses: Dict[int, str] = {}
+
+    for stage_index, stage in enumerate(stages):
+        previous_stage = stages[stage_index - 1] if stage_index > 0 else []
+        previous_stage_completed = all(
+            statuses[step_number] == "completed" for step_number in previous_stage
         )
 
+        move_forward_flags = {}
+        fetched = {}
+        for step_number in stage:
+            # The first step labels the source dataset, other steps of the first
+            # stage start right away from its copy.
+            move_forward_needed = previous_stage_completed and step_number != 1
+            if stage_index == 0:
+                first_poll = workflow.state.steps[1].poll
+                move_forward_needed = (
+                    move_forward_needed
+                    and first_poll is not None
+                    and first_poll.dataset is not None
+                )
+            move_forward_flags[step_number] = move_forward_needed
+
+            # The first step is fetched until it has a queue, it is created from
+            # the source dataset and doesn't wait for another step.
+            last_poll = workflow.state.steps[step_number].poll
+            if last_poll and (
+                last_poll.status == "completed"
+                or (
+                    last_poll.queue is None
+                    and not move_forward_needed
+                    and step_number != 1
+                )
+            ):
+                statuses[step_number] = last_poll.status
+                continue
+            fetched[step_number] = workflow.fetch_step(step_number)
+
+        stage_waiting = any(queue_info is None for _, queue_info in fetched.values())
+        if previous_stage_completed and stage_waiting and len(previous_stage) > 1:
+            workflow.merge_stage(previous_stage)
+
+        for step_number, (dataset_info, queue_info) in fetched.items():
+            fingerprint = get_step_fingerprint(dataset_info, queue_info)
+            last_poll = workflow.state.steps[step_number].poll
+            if (
+                last_poll
+                and last_poll.fingerprint == fingerprint
+                and queue_info
+                and queue_info.status != "completed"
+            ):
+                statuses[step_number] = last_poll.status
+                continue
+
+            item_status, updated_queue_info, _ = process_workflow_step(
+                workflow,
+                step_number,
+                dataset_info,
+                queue_info,
+                move_forward_flags[step_number],
+            )
+            statuses[step_number] = item_status
+            step_state = workflow.state.steps[step_number]
+            step_state.poll = StepPoll(
+                DatasetState.from_info(dataset_info),
+                QueueState.from_info(updated_queue_info or queue_info),
+                item_status,
+                fingerprint,
+            )
+            if step_state.poll.queue:
+                step_state.throughput.observe(step_state.poll.queue, time())
+
+            if display:
+                update_step_display(
+                    step_number,
+                    dataset_info,
+                    updated_queue_info or queue_info,
+                    item_status,
+                )
+
+    if all(statuses[step_number] == "completed" for step_number in stages[-1]):
+        workflow.finalize(stages[-1])
+
 
 @workflow_modal.value_changed
 def handle_modal_state(is_open: bool):
     """Handle modal open/close events."""
+    WorkflowMonitor().monitor_selected = is_open
     if is_open:
+        Workflow().refresh_state()
         WorkflowMonitor().start()
-    else:
+    elif not WorkflowMonitor().workflows:
         WorkflowMonitor().stop()
+    elif Workflow().dataset_id not in WorkflowMonitor().workflows:
+        LeaseManager().release(Workflow().project_id, Workflow().dataset_id)
 
 
 @launch_workflow_button.click
 def launch_workflow():
     """Launch the multi-team labeling workflow."""
     sly.logger.info("Launching workflow...")
+    workflow = Workflow()
+    workflow.refresh_state()
+    report = run_preflight(workflow)
+    if report.issues:
+        preflight_text.set(report.to_text(), "error" if report.errors else "warning")
+        preflight_text.show()
+    else:
+        preflight_text.hide()
+    if not report.ok:
+        sly.logger.warning(
+            f"Workflow is not launched, preflight failed:\n{report.to_text()}"
+        )
+        return
+
+    if WorkflowMonitor.hold(workflow):
+        workflow.provision_downstream_steps()
+        update_workflow_state(
+            workflow.project_id, workflow.dataset_id, {"launched": True}
+        )
+    elif LeaseManager().is_claiming(workflow.project_id, workflow.dataset_id):
+        # Steps are provisioned on demand once the claim is confirmed by the monitor.
+        update_workflow_state(
+            workflow.project_id, workflow.dataset_id, {"launched": True}
+        )
+    else:
+        sly.logger.warning(
+            f"Workflow of Dataset ID {workflow.dataset_id} is run by another instance."
+        )
     workflow_modal.show()
 
 
@@ -347,18 +746,172 @@ def save_workflow():
         sly.logger.warning("Project or Dataset not selected. Cannot save workflow.")
         return
 
-    project_custom_data = g.api.project.get_custom_data(project_id)
-    existing_workflow_config = project_custom_data.get(
-        MULTITEAM_LABELING_WORKFLOW_TITLE, {}
+    Workflow().refresh_state()
+    save_workflow_configs(project_id, {dataset_id: Workflow().to_json()})
+    sly.logger.info("Workflow configuration saved successfully.")
+
+
+def save_workflow_configs(
+    project_id: int, workflow_configs: Dict[int, Dict[int, Dict[str, Any]]]
+) -> None:
+    """Save workflow configurations of several datasets in a single custom data write."""
+
+    def update(existing_workflow_config: Dict[str, Any]) -> None:
+        if not existing_workflow_config:
+            sly.logger.info(
+                "No existing workflow configuration found. Creating new one."
+            )
+        for dataset_id, workflow_data in workflow_configs.items():
+            existing_workflow_config[str(dataset_id)] = workflow_data
+
+    update_project_custom_data(project_id, MULTITEAM_LABELING_WORKFLOW_TITLE, update)
+
+
+@bulk_launch_button.click
+def bulk_launch_workflow():
+    """Apply the configured steps to all matching datasets of the project and
+    launch their workflows."""
+    project_id = select_project.get_selected_id()
+    if not project_id or not Workflow().all_steps_filled():
+        sly.logger.warning(
+            "Project is not selected or workflow steps are not filled. "
+            "Cannot launch workflows in bulk."
+        )
+        return
+
+    template = Workflow().to_json()
+    for step_data in template.values():
+        # Step projects and datasets are resolved for every dataset separately.
+        step_data["project_id"] = None
+        step_data["dataset_id"] = None
+
+    pattern = bulk_filter_input.get_value()
+    dataset_infos = [
+        dataset_info
+        # Step datasets are looked up by name at the top level of the step projects,
+        # so nested datasets are not launched.
+        for dataset_info in g.api.dataset.get_list(project_id)
+        if not pattern or fnmatch(dataset_info.name, pattern)
+    ]
+    if not dataset_infos:
+        sly.logger.warning(f"No datasets match the pattern '{pattern}'.")
+        return
+
+    sly.logger.info(f"Launching workflows for {len(dataset_infos)} datasets.")
+    save_workflow_configs(
+        project_id, {dataset_info.id: template for dataset_info in dataset_infos}
+    )
+    project_info = g.api.project.get_info_by_id(project_id)
+    # All workflows share the classes and tags of the template.
+    meta = get_configs_meta(template)
+    launch_workflows(
+        [
+            HeadlessWorkflow(project_info, dataset_info, template, meta)
+            for dataset_info in dataset_infos
+        ]
     )
-    if not existing_workflow_config:
-        sly.logger.info("No existing workflow configuration found. Creating new one.")
 
-    workflow_data = Workflow().to_json()
-    existing_workflow_config[dataset_id] = workflow_data
-    project_custom_data[MULTITEAM_LABELING_WORKFLOW_TITLE] = existing_workflow_config
-    g.api.project.update_custom_data(project_id, project_custom_data)
-    sly.logger.info("Workflow configuration saved successfully.")
+
+def launch_workflows(workflows: List["HeadlessWorkflow"]) -> None:
+    """Launch headless workflows with bounded concurrency and register them
+    in the monitor. Workflows that fail the preflight checks are not launched.
+
+    The launched flags of all workflows of a project are written in one custom
+    data update, then the workflows run by this instance get their first status
+    update before they're registered, so the monitor doesn't poll them meanwhile.
+    """
+    registered: List[HeadlessWorkflow] = []
+    held: List[HeadlessWorkflow] = []
+    launched_ids: Dict[int, List[int]] = defaultdict(list)
+    team_members = TeamMembers()
+    monitor = WorkflowMonitor()
+    # Registered before the launched flags are written, so discovery doesn't
+    # register another workflow for the same dataset.
+    monitor.launching.update(workflow.dataset_id for workflow in workflows)
+    try:
+        with bulk_progress(message="Launching workflows", total=len(workflows)) as pbar:
+            with ThreadPoolExecutor(max_workers=BULK_LAUNCH_WORKERS) as executor:
+                futures = {
+                    executor.submit(
+                        launch_headless_workflow, workflow, team_members
+                    ): workflow
+                    for workflow in workflows
+                }
+                for future in as_completed(futures):
+                    workflow = futures[future]
+                    try:
+                        launch = future.result()
+                    except Exception as e:
+                        sly.logger.error(
+                            f"Failed to launch workflow for Dataset ID {workflow.dataset_id}: {e}"
+                        )
+                    else:
+                        # A workflow run by another instance is only registered
+                        # for failover.
+                        registered.append(workflow)
+                        if launch is not None:
+                            launched_ids[workflow.project_id].append(
+                                workflow.dataset_id
+                            )
+                        if launch == LAUNCH_HELD:
+                            held.append(workflow)
+                    pbar.update(1)
+
+        for project_id, dataset_ids in launched_ids.items():
+            update_workflow_states(
+                project_id,
+                {dataset_id: {"launched": True} for dataset_id in dataset_ids},
+            )
+
+        with ThreadPoolExecutor(max_workers=BULK_LAUNCH_WORKERS) as executor:
+            futures = {
+                executor.submit(
+                    update_workflow_status, workflow, display=False
+                ): workflow
+                for workflow in held
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    sly.logger.error(
+                        f"Failed to update workflow for Dataset ID "
+                        f"{futures[future].dataset_id}: {e}"
+                    )
+
+        for workflow in registered:
+            monitor.register(workflow)
+    finally:
+        monitor.launching.difference_update(
+            workflow.dataset_id for workflow in workflows
+        )
+
+    sly.logger.info(f"Launched {len(registered)} of {len(workflows)} workflows.")
+    if registered and not monitor.active:
+        monitor.start()
+
+
+def launch_headless_workflow(
+    workflow: "HeadlessWorkflow", team_members: Optional[TeamMembers] = None
+) -> Optional[str]:
+    """Check a headless workflow and provision its steps if this instance runs it.
+
+    Returns:
+        LAUNCH_HELD if the workflow is run by this instance, LAUNCH_CLAIMING if its
+        lease claim waits for confirmation (steps are provisioned on demand once the
+        monitor confirms it), None if it is run by another instance. The caller
+        writes the launched flag.
+    """
+    report = run_preflight(workflow, team_members)
+    if not report.ok:
+        raise ValueError(f"preflight failed:\n{report.to_text()}")
+
+    if WorkflowMonitor.hold(workflow):
+        workflow.provision_downstream_steps()
+        return LAUNCH_HELD
+    if LeaseManager().is_claiming(workflow.project_id, workflow.dataset_id):
+        return LAUNCH_CLAIMING
+    return None
 
 
 @select_project.value_changed
@@ -383,6 +936,7 @@ def on_project_change(project_id: int):
         workflow_step_1.reviewer_selector.set_team_id(g.TEAM_ID)
         workflow_step_1.labeler_selector.set_team_id(g.TEAM_ID)
         workflow_step_1.quality_check_selector.set_team_id(g.TEAM_ID)
+        workflow_step_1.overflow_labeler_selector.set_team_id(g.TEAM_ID)
 
         # Set classes from project meta
         if project_meta.obj_classes:
@@ -414,6 +968,11 @@ def update_dataset(dataset_id: int):
     sly.logger.info(
         f"Loading workflow for Project ID: {project_id}, Dataset ID: {dataset_id}"
     )
+    Workflow().reset_runtime_state()
+    load_escalated_teams(g.api.project.get_custom_data(project_id))
+    workflow_state = get_workflow_state(project_id, dataset_id)
+    if workflow_state.get("reclaimed"):
+        Workflow().state.finalized = Workflow().state.reclaimed = True
     existing_workflow_config = get_existing_workflow_config(project_id)
     dataset_workflow_data = existing_workflow_config.get(str(dataset_id), {})
     if dataset_workflow_data:
@@ -421,23 +980,61 @@ def update_dataset(dataset_id: int):
         Workflow().from_json(dataset_workflow_data)
     else:
         sly.logger.info("No existing workflow configuration for this dataset.")
+        Workflow().refresh_state()
+    Workflow().load_quality_check_stats(workflow_state)
 
     if Workflow().all_steps_filled():
         launch_workflow_button.enable()
 
 
+def get_step_span_attrs(workflow_step: "WorkflowStep") -> Dict[str, Any]:
+    return {
+        "dataset_id": workflow_step.workflow.dataset_id,
+        "step": workflow_step.step_number,
+    }
+
+
 class WorkflowStep:
 
-    def __init__(self, step_number: int):
+    def __init__(self, step_number: int, workflow: "BaseWorkflow"):
         self.step_number = step_number
-        self.team_id: Optional[int] = None
-        self.workspace_id: Optional[int] = None
-        self.team_id: Optional[int] = None
-        self.project_id: Optional[int] = None
-        self.dataset_id: Optional[int] = None
+        self.workflow = workflow
+        workflow.state.steps.setdefault(step_number, StepState())
         self._content: Optional[Card] = None
         self._add_content()
 
+    @property
+    def state(self) -> StepState:
+        return self.workflow.state.steps[self.step_number]
+
+    @property
+    def config(self) -> StepConfig:
+        return self.state.config
+
+    @property
+    def project_id(self) -> Optional[int]:
+        return self.state.project_id
+
+    @project_id.setter
+    def project_id(self, project_id: Optional[int]) -> None:
+        self.state.project_id = project_id
+
+    @property
+    def dataset_id(self) -> Optional[int]:
+        return self.state.dataset_id
+
+    @dataset_id.setter
+    def dataset_id(self, dataset_id: Optional[int]) -> None:
+        self.state.dataset_id = dataset_id
+
+    @property
+    def dataset_items_count(self) -> Optional[int]:
+        return self.state.items_count
+
+    @dataset_items_count.setter
+    def dataset_items_count(self, items_count: Optional[int]) -> None:
+        self.state.items_count = items_count
+
     def is_filled(self) -> bool:
         # TODO: Refactor me
         if not self.team_selector.get_selected_id():
@@ -465,33 +1062,39 @@ class WorkflowStep:
             return False
         return True
 
+    def get_classes(self) -> List[sly.ObjClass]:
+        meta = self.workflow.state.meta
+        return [meta.get_obj_class(name) for name in self.config.class_names]
+
+    def get_tags(self) -> List[sly.TagMeta]:
+        meta = self.workflow.state.meta
+        return [meta.get_tag_meta(name) for name in self.config.tag_names]
+
     def is_dataset_exists(self) -> bool:
-        team_id = self.team_selector.get_selected_id()
-        if not team_id:
+        if not self.config.team_id:
             sly.logger.warning("Cannot check dataset existence: team ID is missing.")
             return False
 
-        self.team_id = team_id
-
-        workspace_id = self.workspace_selector.get_selected_id()
-        project_name = WorkflowSettings().get_project_name()
+        workspace_id = self.config.workspace_id
+        project_name = self.workflow.get_project_name()
         if not workspace_id or not project_name:
             sly.logger.warning(
                 "Cannot check dataset existence: workspace ID or project name is missing."
             )
             return False
 
-        self.workspace_id = workspace_id
         project_info = g.api.project.get_info_by_name(workspace_id, project_name)
         if not project_info:
-            sly.logger.info(
-                f"Project {project_name} does not exist in workspace ID {workspace_id}."
+            sly.logger.debug(
+                "Project %s does not exist in workspace ID %s.",
+                project_name,
+                workspace_id,
             )
             return False
 
         self.project_id = project_info.id
 
-        dataset_name = WorkflowSettings().get_dataset_name()
+        dataset_name = self.workflow.get_dataset_name()
         if not dataset_name:
             sly.logger.warning(
                 "Cannot check dataset existence: dataset name is missing."
@@ -499,35 +1102,33 @@ class WorkflowStep:
             return False
         dataset_info = g.api.dataset.get_info_by_name(project_info.id, dataset_name)
         if not dataset_info:
-            sly.logger.info(
-                f"Dataset {dataset_name} does not exist in project ID {project_info.id}."
+            sly.logger.debug(
+                "Dataset %s does not exist in project ID %s.",
+                dataset_name,
+                project_info.id,
             )
             return False
 
         self.dataset_id = dataset_info.id
+        self.dataset_items_count = dataset_info.items_count
 
         return True
 
+    @traced("create_labeling_queue", lambda self: get_step_span_attrs(self))
     def create_labeling_queue(self) -> Optional[LabelingQueueInfo]:
         if not self.dataset_id:
             sly.logger.warning("Cannot create labeling queue: dataset ID is missing.")
             return None
 
-        self.update_project_meta()
-        sly.logger.info(
-            f"Meta updated, creating labeling queue for Dataset ID {self.dataset_id}."
-        )
+        # Provisioned steps got the classes and tags of all steps up to them.
+        if not self.state.provisioned:
+            self.update_project_meta()
+        sly.logger.info(f"Creating labeling queue for Dataset ID {self.dataset_id}.")
         queue_name = self.get_labeling_queue_name()
 
-        annotor_ids = [
-            user.id for user in self.labeler_selector.get_selected_user() or []
-        ]
-        reviewer_ids = [
-            user.id for user in self.reviewer_selector.get_selected_user() or []
-        ]
-        quality_check_ids = [
-            user.id for user in self.quality_check_selector.get_selected_user() or []
-        ]
+        annotor_ids = list(self.config.labeler_ids)
+        reviewer_ids = list(self.config.reviewer_ids)
+        quality_check_ids = list(self.config.quality_check_ids)
 
         if not annotor_ids or not reviewer_ids or not quality_check_ids:
             sly.logger.warning(
@@ -535,22 +1136,27 @@ class WorkflowStep:
             )
             return None
 
-        queue_id = g.api.labeling_queue.create(
-            name=queue_name,
+        queue_kwargs = dict(
             user_ids=annotor_ids,
             reviewer_ids=reviewer_ids,
             dataset_id=self.dataset_id,
-            classes_to_label=[
-                sly_class.name
-                for sly_class in self.class_selector.get_selected_class() or []
-            ],
-            tags_to_label=[
-                tag.name for tag in self.tag_selector.get_selected_tag() or []
-            ],
-            enable_quality_check=True,
-            quality_check_user_ids=quality_check_ids,
+            classes_to_label=list(self.config.class_names),
+            tags_to_label=list(self.config.tag_names),
             # TODO: Labeler sees figures: Edit only own (add to SDK).
         )
+
+        sample_fraction = get_sample_fraction(self.config.team_id)
+        if sample_fraction >= 1:
+            queue_id = g.api.labeling_queue.create(
+                name=queue_name,
+                enable_quality_check=True,
+                quality_check_user_ids=quality_check_ids,
+                **queue_kwargs,
+            )
+        else:
+            queue_id = self.create_sampled_labeling_queues(
+                queue_name, sample_fraction, quality_check_ids, queue_kwargs
+            )
         queue_info = g.api.labeling_queue.get_info_by_id(queue_id)
 
         sly.logger.info(
@@ -559,6 +1165,49 @@ class WorkflowStep:
 
         return queue_info
 
+    def create_sampled_labeling_queues(
+        self,
+        queue_name: str,
+        sample_fraction: float,
+        quality_check_ids: List[int],
+        queue_kwargs: Dict[str, Any],
+    ) -> int:
+        """Create the main queue with quality check for a sample of the items
+        and an auxiliary queue without quality check for the rest of them.
+
+        Returns:
+            ID of the main queue.
+        """
+        image_ids = [
+            image_info.id for image_info in g.api.image.get_list(self.dataset_id)
+        ]
+        strata = None
+        if g.QUALITY_CHECK_STRATIFIED:
+            class_names = list(self.config.class_names)
+            strata = get_image_strata(self.dataset_id, image_ids, class_names)
+        checked_ids = sample_image_ids(image_ids, sample_fraction, strata)
+        unchecked_ids = sorted(set(image_ids) - set(checked_ids))
+        sly.logger.info(
+            f"Quality check sample for Workflow Step {self.step_number}: "
+            f"{len(checked_ids)} of {len(image_ids)} items."
+        )
+
+        queue_id = g.api.labeling_queue.create(
+            name=queue_name,
+            images_ids=checked_ids,
+            enable_quality_check=True,
+            quality_check_user_ids=quality_check_ids,
+            **queue_kwargs,
+        )
+        if unchecked_ids:
+            g.api.labeling_queue.create(
+                name=f"{queue_name}{AUXILIARY_QUEUE_SEPARATOR}{NO_QUALITY_CHECK_QUEUE_KIND}_1",
+                images_ids=unchecked_ids,
+                enable_quality_check=False,
+                **queue_kwargs,
+            )
+        return queue_id
+
     def update_project_meta(self) -> None:
         if not self.project_id:
             sly.logger.warning("Cannot update project meta: project ID is missing.")
@@ -571,7 +1220,7 @@ class WorkflowStep:
             f"Updating project meta for project ID {self.project_id} in workflow step {self.step_number}."
         )
 
-        selected_classes = self.class_selector.get_selected_class() or []
+        selected_classes = self.get_classes()
         for sly_class in selected_classes:
             if not project_meta.get_obj_class(sly_class.name):
                 sly.logger.info(f"Adding class {sly_class.name} to project meta.")
@@ -581,7 +1230,7 @@ class WorkflowStep:
             f"Added {len(selected_classes)} classes to project meta for project ID {self.project_id}."
         )
 
-        selected_tags = self.tag_selector.get_selected_tag() or []
+        selected_tags = self.get_tags()
         for tag in selected_tags:
             if not project_meta.get_tag_meta(tag.name):
                 sly.logger.info(f"Adding tag {tag.name} to project meta.")
@@ -596,8 +1245,20 @@ class WorkflowStep:
             f"Project meta updated successfully for project ID {self.project_id}."
         )
 
+    @traced("move_forward", lambda self: get_step_span_attrs(self))
     def move_forward(self) -> Optional[LabelingQueueInfo]:
-        if not self.is_dataset_exists():
+        if self.state.provisioned:
+            # The dataset and the meta were created at launch, only the items and
+            # the queue are left.
+            self.copy_items_from_previous_step()
+            return self.create_labeling_queue()
+
+        dataset_exists = self.is_dataset_exists()
+        if dataset_exists:
+            # A pre-provisioned dataset is empty, an interrupted copy left part of
+            # the items in it.
+            self.copy_items_from_previous_step()
+        else:
             sly.logger.info(
                 "Dataset does not exist; copying dataset from previous step."
             )
@@ -626,14 +1287,82 @@ class WorkflowStep:
             )
             return
 
+    def provision(self, source_meta: sly.ProjectMeta) -> None:
+        """Create this step's project with the required meta and an empty dataset
+        in advance, so the transition only has to copy items and create a queue."""
+        workspace_id = self.config.workspace_id
+        project_name = self.workflow.get_project_name()
+        dataset_name = self.workflow.get_dataset_name()
+        if not workspace_id or not project_name or not dataset_name:
+            sly.logger.warning(
+                f"Cannot provision Workflow Step {self.step_number}: "
+                "workspace ID, project name or dataset name is missing."
+            )
+            return
+
+        with get_step_project_lock(workspace_id, project_name):
+            project_info = g.api.project.get_or_create(workspace_id, project_name)
+            project_meta = sly.ProjectMeta.from_json(
+                g.api.project.get_meta(project_info.id)
+            )
+            project_meta = project_meta.merge(source_meta)
+            g.api.project.update_meta(project_info.id, project_meta.to_json())
+
+            dataset_info = g.api.dataset.get_or_create(project_info.id, dataset_name)
+        self.project_id = project_info.id
+        self.dataset_id = dataset_info.id
+        self.dataset_items_count = dataset_info.items_count
+        self.state.provisioned = True
+        sly.logger.info(
+            f"Provisioned Workflow Step {self.step_number}: project ID "
+            f"{self.project_id}, dataset ID {self.dataset_id}."
+        )
+
+    @traced("copy_items_from_previous_step", lambda self: get_step_span_attrs(self))
+    def copy_items_from_previous_step(self) -> None:
+        """Copy the items of the previous step's dataset that are missing in this
+        step's dataset, matched by name."""
+        previous_step = self.workflow.get_source_step(self.step_number)
+        if not previous_step or not previous_step.dataset_id:
+            sly.logger.warning(
+                "Cannot copy items: previous step's dataset ID is missing."
+            )
+            return
+
+        source_infos = g.api.image.get_list(previous_step.dataset_id)
+        if (self.dataset_items_count or 0) >= len(source_infos):
+            return
+        copied_names = set()
+        if self.dataset_items_count:
+            copied_names = {
+                image_info.name for image_info in g.api.image.get_list(self.dataset_id)
+            }
+            sly.logger.info(
+                f"Dataset ID {self.dataset_id} has {len(copied_names)} of "
+                f"{len(source_infos)} items; resuming the copy."
+            )
+        image_ids = [
+            image_info.id
+            for image_info in source_infos
+            if image_info.name not in copied_names
+        ]
+        if image_ids:
+            g.api.image.copy_batch(self.dataset_id, image_ids, with_annotations=True)
+        self.dataset_items_count = len(copied_names) + len(image_ids)
+        sly.logger.info(
+            f"Copied {len(image_ids)} items from dataset ID {previous_step.dataset_id} "
+            f"to dataset ID {self.dataset_id} for workflow step {self.step_number}."
+        )
+
+    @traced("copy_dataset_from_previous_step", lambda self: get_step_span_attrs(self))
     def copy_dataset_from_previous_step(self) -> None:
         if self.step_number <= 1:
             sly.logger.info(
                 "This is the first workflow step; no previous step to copy dataset from."
             )
             return
-        previous_step = Workflow().steps.get(self.step_number - 1)
-        workspace_id = self.workspace_selector.get_selected_id()
+        previous_step = self.workflow.get_source_step(self.step_number)
+        workspace_id = self.config.workspace_id
         if not previous_step or not workspace_id:
             sly.logger.warning(
                 "Cannot copy dataset: previous step or current workspace ID is missing."
@@ -648,8 +1377,8 @@ class WorkflowStep:
             )
             return
 
-        dst_project_name = WorkflowSettings().get_project_name()
-        dst_dataset_name = WorkflowSettings().get_dataset_name()
+        dst_project_name = self.workflow.get_project_name()
+        dst_dataset_name = self.workflow.get_dataset_name()
 
         sly.logger.info(
             f"Copying dataset ID {previous_dataset_id} from project ID {previous_project_id} "
@@ -661,36 +1390,39 @@ class WorkflowStep:
         previous_project_meta_json = g.api.project.get_meta(previous_project_id)
         previous_project_meta = sly.ProjectMeta.from_json(previous_project_meta_json)
 
-        # Ensure that the project not exists before trying to create it
-        # by using get_or_create method.
-        new_project_info = g.api.project.get_or_create(
-            workspace_id,
-            dst_project_name,
-        )
-        new_project_id = new_project_info.id
-        sly.logger.info(
-            f"Created or found project ID {new_project_id} in workspace ID {workspace_id}."
-        )
+        # The project can't be removed as empty by the reclaim of another workflow
+        # until the dataset is copied into it.
+        with get_step_project_lock(workspace_id, dst_project_name):
+            # Ensure that the project not exists before trying to create it
+            # by using get_or_create method.
+            new_project_info = g.api.project.get_or_create(
+                workspace_id,
+                dst_project_name,
+            )
+            new_project_id = new_project_info.id
+            sly.logger.info(
+                f"Created or found project ID {new_project_id} in workspace ID {workspace_id}."
+            )
 
-        # Set the project meta (classes and tags)
-        g.api.project.update_meta(new_project_id, previous_project_meta.to_json())
-        sly.logger.info(
-            f"Updated project meta for new project ID {new_project_id}. "
-            "Copying dataset now..."
-        )
+            # Set the project meta (classes and tags)
+            g.api.project.update_meta(new_project_id, previous_project_meta.to_json())
+            sly.logger.info(
+                f"Updated project meta for new project ID {new_project_id}. "
+                "Copying dataset now..."
+            )
 
-        sly.logger.debug(
-            f"Copying dataset {dst_dataset_name} to project ID {new_project_id} from "
-            f"previous project ID {previous_project_id} and dataset ID {previous_dataset_id}."
-        )
+            sly.logger.debug(
+                f"Copying dataset {dst_dataset_name} to project ID {new_project_id} from "
+                f"previous project ID {previous_project_id} and dataset ID {previous_dataset_id}."
+            )
 
-        # Copy the dataset to the new project
-        new_dataset_info = g.api.dataset.copy(
-            new_project_id,
-            previous_dataset_id,
-            new_name=dst_dataset_name,
-            with_annotations=True,
-        )
+            # Copy the dataset to the new project
+            new_dataset_info = g.api.dataset.copy(
+                new_project_id,
+                previous_dataset_id,
+                new_name=dst_dataset_name,
+                with_annotations=True,
+            )
 
         # Update this step's project_id and dataset_id
         self.project_id = new_project_id
@@ -710,16 +1442,23 @@ class WorkflowStep:
     def get_labeling_queue_name(self) -> str:
         return (
             f"{MULTITEAM_LABELING_WORKFLOW_MARKER}_Dataset_{self.dataset_id}"
-            f"_Team_{self.team_id}_Step_{self.step_number}"
+            f"_Team_{self.config.team_id}_Step_{self.step_number}"
         )
 
     def get_labeling_queue(self) -> Optional[LabelingQueueInfo]:
         queue_infos = g.api.labeling_queue.get_list(
-            self.team_id, dataset_id=self.dataset_id
+            self.config.team_id, dataset_id=self.dataset_id
         )
+        queue_infos = [
+            queue_info
+            for queue_info in queue_infos or []
+            if not is_auxiliary_queue_name(queue_info.name)
+        ]
         if not queue_infos:
-            sly.logger.info(
-                f"No labeling queues found for Dataset ID {self.dataset_id} in Team ID {self.team_id}."
+            sly.logger.debug(
+                "No labeling queues found for Dataset ID %s in Team ID %s.",
+                self.dataset_id,
+                self.config.team_id,
             )
             return None
 
@@ -730,8 +1469,9 @@ class WorkflowStep:
                     matching_queues.append(queue_info)
 
         if not matching_queues:
-            sly.logger.info(
-                f"No labeling queue with marker found for Dataset ID {self.dataset_id}."
+            sly.logger.debug(
+                "No labeling queue with marker found for Dataset ID %s.",
+                self.dataset_id,
             )
             return None
 
@@ -742,6 +1482,26 @@ class WorkflowStep:
 
         return matching_queues[0]
 
+    def get_auxiliary_queues(
+        self, kind: Optional[str] = None
+    ) -> List[LabelingQueueInfo]:
+        """Return the auxiliary queues created for this step (e.g. overflow queues).
+
+        Overflow queues label nested datasets of the step, so queues are looked up
+        in the step project by name.
+        """
+        prefix = self.get_labeling_queue_name() + AUXILIARY_QUEUE_SEPARATOR
+        if kind:
+            prefix += kind
+        queue_infos = g.api.labeling_queue.get_list(
+            self.config.team_id, project_id=self.project_id
+        )
+        return [
+            queue_info
+            for queue_info in queue_infos or []
+            if queue_info.name.startswith(prefix)
+        ]
+
     def to_json(self) -> Dict[str, Any]:
         selected_classes = self.class_selector.get_selected_class() or []
         classes_json = [sly_class.to_json() for sly_class in selected_classes]
@@ -754,6 +1514,9 @@ class WorkflowStep:
         quality_check_ids = [
             user.id for user in self.quality_check_selector.get_selected_user()
         ]
+        overflow_labeler_ids = [
+            user.id for user in self.overflow_labeler_selector.get_selected_user() or []
+        ]
 
         data = {
             "step_number": self.step_number,
@@ -765,30 +1528,30 @@ class WorkflowStep:
             "selected_tags": tags_json,
             "reviewer_ids": reviewer_ids,
             "labeler_ids": labeler_ids,
+            "quality_check_ids": quality_check_ids,
+            "overflow_labeler_ids": overflow_labeler_ids,
         }
         return data
 
     def update_from_json(self, data: Dict[str, Any]) -> None:
         self.step_number = data.get("step_number")
-        self.team_id = data.get("team_id")
-        self.workspace_id = data.get("workspace_id")
+        team_id = data.get("team_id")
+        workspace_id = data.get("workspace_id")
         self.project_id = data.get("project_id")
         self.dataset_id = data.get("dataset_id")
         sly.logger.info(
             f"Updating Workflow Step {self.step_number} from JSON data."
-            f"Team ID: {self.team_id}, Workspace ID: {self.workspace_id}, "
+            f"Team ID: {team_id}, Workspace ID: {workspace_id}, "
             f"Project ID: {self.project_id}, Dataset ID: {self.dataset_id}"
         )
 
         # Set team and workspace
-        if self.team_id:
-            self.team_selector.set_team_id(self.team_id)
-        if self.workspace_id:
-            # self.workspace_selector.set_team_id(self.team_id)
-            # self.workspace_selector.set_workspace_id(self.workspace_id)
-            self.workspace_selector.set_ids(
-                team_id=self.team_id, workspace_id=self.workspace_id
-            )
+        if team_id:
+            self.team_selector.set_team_id(team_id)
+        if workspace_id:
+            # self.workspace_selector.set_team_id(team_id)
+            # self.workspace_selector.set_workspace_id(workspace_id)
+            self.workspace_selector.set_ids(team_id=team_id, workspace_id=workspace_id)
 
         # Set classes
         classes_json = data.get("selected_classes", [])
@@ -810,16 +1573,22 @@ class WorkflowStep:
         reviewer_ids = data.get("reviewer_ids", [])
         labeler_ids = data.get("labeler_ids", [])
         quality_check_ids = data.get("quality_check_ids", [])
-        if self.team_id:
-            self.reviewer_selector.set_team_id(self.team_id)
-            self.labeler_selector.set_team_id(self.team_id)
-            self.quality_check_selector.set_team_id(self.team_id)
+        overflow_labeler_ids = data.get("overflow_labeler_ids", [])
+        if team_id:
+            self.reviewer_selector.set_team_id(team_id)
+            self.labeler_selector.set_team_id(team_id)
+            self.quality_check_selector.set_team_id(team_id)
+            self.overflow_labeler_selector.set_team_id(team_id)
         if reviewer_ids:
             self.reviewer_selector.set_selected_users_by_ids(reviewer_ids)
         if labeler_ids:
             self.labeler_selector.set_selected_users_by_ids(labeler_ids)
         if quality_check_ids:
             self.quality_check_selector.set_selected_users_by_ids(quality_check_ids)
+        if overflow_labeler_ids:
+            self.overflow_labeler_selector.set_selected_users_by_ids(
+                overflow_labeler_ids
+            )
 
     def _add_content(self) -> None:
         self.team_selector = SelectTeam(show_label=False)
@@ -877,22 +1646,35 @@ class WorkflowStep:
             title="Quality Check",
         )
 
+        self.overflow_labeler_selector = SelectUser(
+            roles=["annotator", "reviewer"], multiple=True
+        )
+        overflow_labeler_field = Field(
+            self.overflow_labeler_selector,
+            title="Overflow Labelers",
+            description="Join the step when its backlog exceeds the rebalance threshold.",
+        )
+
         users_container = Flexbox(
-            [reviewer_field, labeler_field, quality_check_field],
+            [
+                reviewer_field,
+                labeler_field,
+                quality_check_field,
+                overflow_labeler_field,
+            ],
         )
 
         @self.team_selector.value_changed
         def on_team_change(team_id: int):
-            self.team_id = team_id
             self.workspace_selector.set_team_id(team_id)
             self.reviewer_selector.set_team_id(team_id)
             self.labeler_selector.set_team_id(team_id)
             self.quality_check_selector.set_team_id(team_id)
+            self.overflow_labeler_selector.set_team_id(team_id)
             Workflow().all_steps_filled()
 
         @self.workspace_selector.value_changed
         def on_selection_change(workspace_id: int):
-            self.workspace_id = workspace_id
             sly.logger.info(
                 f"Workflow Step {self.step_number} - Workspace ID: {workspace_id}"
             )
@@ -930,12 +1712,342 @@ class WorkflowStep:
         return self._content
 
 
-class Workflow(metaclass=Singleton):
+class HeadlessWorkflowStep(WorkflowStep):
+    """Workflow step restored from a saved configuration, without UI widgets."""
+
+    def _add_content(self) -> None:
+        pass
+
+
+class SingletonABCMeta(Singleton, ABCMeta):
+    pass
+
+
+class BaseWorkflow(ABC):
+    """Steps of a workflow for one dataset and the orchestration shared by the
+    workflow configured in the UI and the headless ones launched in bulk."""
+
     def __init__(self):
         self.steps: Dict[int, WorkflowStep] = {}
+        self.state = WorkflowState()
+
+    def reset_runtime_state(self) -> None:
+        """Forget the progress tracked in memory, e.g. when another dataset is selected."""
+        self.state.reset()
+
+    def set_configs(
+        self,
+        configs: Dict[Any, Dict[str, Any]],
+        meta: Optional[sly.ProjectMeta] = None,
+    ) -> None:
+        """Load step configurations in the saved format into the workflow state,
+        which is the only source of configuration for monitoring and orchestration.
+
+        Args:
+            configs: Step configurations by step number.
+            meta: Classes and tags of all steps, built from the configs if not set.
+        """
+        self.state.meta = meta or get_configs_meta(configs)
+        if g.PARALLEL_INDEPENDENT_STEPS:
+            self.state.stages = get_parallel_stages(configs)
+        else:
+            self.state.stages = [
+                [int(step_number)] for step_number in sorted(configs, key=int)
+            ]
+        for step_number, data in configs.items():
+            step_state = self.state.steps.setdefault(int(step_number), StepState())
+            step_state.config = StepConfig.from_json(data)
+
+    @property
+    @abstractmethod
+    def project_id(self) -> Optional[int]:
+        pass
+
+    @property
+    @abstractmethod
+    def dataset_id(self) -> Optional[int]:
+        pass
+
+    @abstractmethod
+    def get_project_name(self) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    def get_dataset_name(self) -> Optional[str]:
+        pass
+
+    def get_stages(self) -> List[List[int]]:
+        """Return the steps grouped into stages that run one after another."""
+        return self.state.stages or [
+            [step_number] for step_number in sorted(self.steps)
+        ]
+
+    def get_source_step(self, step_number: int) -> Optional["WorkflowStep"]:
+        """Return the step whose dataset is copied to start the given step: the last
+        step of the previous stage, or the first step for the first stage."""
+        stages = self.get_stages()
+        for stage_index, stage in enumerate(stages):
+            if step_number in stage:
+                if stage_index == 0:
+                    return self.steps.get(stage[0])
+                return self.steps.get(stages[stage_index - 1][-1])
+        return None
+
+    def merge_stage(self, stage: List[int]) -> None:
+        """Merge annotations of the parallel steps of a stage into its last step."""
+        if tuple(stage) in self.state.merged_stages:
+            return
+
+        target_step = self.steps[stage[-1]]
+        sources = [
+            MergeSource(
+                self.steps[step_number].project_id,
+                self.steps[step_number].dataset_id,
+                set(self.steps[step_number].config.class_names),
+                set(self.steps[step_number].config.tag_names),
+            )
+            for step_number in stage[:-1]
+        ]
+        sly.logger.info(
+            f"Merging annotations of steps {stage[:-1]} into step {stage[-1]}."
+        )
+        merge_stage_datasets(target_step.project_id, target_step.dataset_id, sources)
+        self.state.merged_stages.add(tuple(stage))
+
+    def finalize(self, last_stage: List[int]) -> None:
+        """Final pipeline stage: merge the last stage if its steps ran in parallel,
+        compute the changes made by every step and write the final annotations back
+        to the source dataset.
+
+        The deltas are computed on a background worker. Until they're done, the
+        workflow stays unfinished and the following polls call this method again.
+        """
+        if self.state.finalized:
+            return
+
+        workflow_state = get_workflow_state(self.project_id, self.dataset_id)
+        # Finalized by an instance that stopped before reclaiming the step datasets.
+        if workflow_state.get("finalized"):
+            self.state.finalized = True
+            return
+
+        if len(last_stage) > 1:
+            self.merge_stage(last_stage)
+
+        state_updates: Dict[str, Any] = {"finalized": True}
+        # Measured throughput of the teams is used by the capacity simulator.
+        throughput = self.get_throughput()
+        if throughput:
+            state_updates["throughput"] = {
+                **workflow_state.get("throughput", {}),
+                **throughput,
+            }
+        # Deltas are computed before the write-back changes the source dataset.
+        if g.COMPUTE_STEP_DELTAS and "deltas" not in workflow_state:
+            if self.state.deltas is None:
+                self.state.deltas = submit_workflow_deltas(
+                    self.dataset_id, self.get_delta_sources()
+                )
+            if not self.state.deltas.done():
+                return
+            future, self.state.deltas = self.state.deltas, None
+            try:
+                deltas = future.result()
+            except Exception as e:
+                sly.logger.error(
+                    f"Failed to compute step deltas of Dataset ID {self.dataset_id}, "
+                    f"retrying on the next poll: {e}"
+                )
+                return
+            state_updates["deltas"] = {
+                str(step_number): totals for step_number, totals in deltas.items()
+            }
+
+        if g.WRITE_BACK_RESULTS:
+            if workflow_state.get("write_back") != WRITE_BACK_DONE:
+                last_step = self.steps[last_stage[-1]]
+                if last_step.dataset_id != self.dataset_id:
+                    write_back_annotations(
+                        last_step.project_id,
+                        last_step.dataset_id,
+                        self.project_id,
+                        self.dataset_id,
+                    )
+                state_updates["write_back"] = WRITE_BACK_DONE
+                sly.logger.info(
+                    f"Final annotations written back to Dataset ID {self.dataset_id}."
+                )
+
+        update_workflow_state(self.project_id, self.dataset_id, state_updates)
+        self.state.finalized = True
+
+    def get_throughput(self) -> Dict[str, Dict[str, Any]]:
+        """Return the throughput measured in the labeling queues of the steps."""
+        throughput = {}
+        for step_number, step_state in self.state.steps.items():
+            data = step_state.throughput.to_json(step_state.config)
+            if data:
+                throughput[str(step_number)] = data
+        return throughput
+
+    def get_quality_check_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return the quality check rejections of the steps in the saved format."""
+        return {
+            str(step_number): step_state.quality_check.to_json()
+            for step_number, step_state in self.state.steps.items()
+            if step_state.quality_check.queue_id is not None
+        }
+
+    def load_quality_check_stats(self, workflow_state: Dict[str, Any]) -> None:
+        """Restore the quality check rejections saved in the workflow state."""
+        for step_number, data in workflow_state.get("quality_check", {}).items():
+            step_state = self.state.steps.get(int(step_number))
+            if step_state is not None:
+                step_state.quality_check = QualityCheckStats.from_json(data)
+
+    def get_delta_sources(self) -> List[DeltaSource]:
+        """Datasets to compare for every step: the step's dataset and the one it was
+        copied from. Steps of parallel stages are compared only by their own classes
+        and tags, the datasets they start from are labeled by other steps too."""
+        sources = []
+        for stage in self.get_stages():
+            for step_number in stage:
+                workflow_step = self.steps[step_number]
+                if step_number == 1:
+                    from_dataset_id = self.dataset_id
+                else:
+                    from_dataset_id = self.get_source_step(step_number).dataset_id
+                if not workflow_step.dataset_id:
+                    continue
+                snapshot_path = None
+                if from_dataset_id == workflow_step.dataset_id:
+                    # Labeled in place, compared with the annotations saved before.
+                    snapshot_path = get_snapshot_path(from_dataset_id)
+                class_names = tag_names = None
+                if len(stage) > 1:
+                    class_names = set(workflow_step.config.class_names)
+                    tag_names = set(workflow_step.config.tag_names)
+                sources.append(
+                    DeltaSource(
+                        step_number,
+                        from_dataset_id,
+                        workflow_step.dataset_id,
+                        class_names,
+                        tag_names,
+                        snapshot_path,
+                    )
+                )
+        return sources
+
+    def snapshot_source(self) -> bool:
+        """Save the source annotations on a background worker before the first step
+        labels the source dataset in place, so the step's delta can be computed.
+
+        Returns:
+            True once the annotations are saved, or if they're not needed or can't
+            be saved. Then the first step's labeling queue can be created.
+        """
+        if not g.COMPUTE_STEP_DELTAS:
+            return True
+        if os.path.exists(get_snapshot_path(self.dataset_id)):
+            return True
+        if self.state.snapshot is None:
+            self.state.snapshot = submit_snapshot(self.dataset_id)
+        if not self.state.snapshot.done():
+            return False
+        future, self.state.snapshot = self.state.snapshot, None
+        try:
+            future.result()
+        except Exception as e:
+            sly.logger.error(
+                f"Failed to save annotations of Dataset ID {self.dataset_id}, "
+                f"the delta of the first step will be unavailable: {e}"
+            )
+        return True
+
+    def get_reclaim_plan(self) -> ReclaimPlan:
+        """Plan removal of the step datasets known from the last poll."""
+        step_datasets = []
+        for step_number in sorted(self.steps):
+            last_poll = self.state.steps[step_number].poll
+            step_datasets.append(last_poll.dataset if last_poll else None)
+        return plan_reclaim(
+            self.project_id, self.dataset_id, step_datasets, g.RECLAIM_KEEP_LAST
+        )
+
+    def fetch_step(
+        self, step_number: int
+    ) -> Tuple[Optional[sly.DatasetInfo], Optional[LabelingQueueInfo]]:
+        """Fetch the dataset and the labeling queue of a step. A queue known from
+        the last poll is re-read by ID, otherwise both are looked up by name,
+        except for the dataset of a provisioned step."""
+        workflow_step = self.steps[step_number]
+        last_poll = workflow_step.state.poll
+        if last_poll and last_poll.queue:
+            dataset_info = g.api.dataset.get_info_by_id(workflow_step.dataset_id)
+            queue_info = g.api.labeling_queue.get_info_by_id(last_poll.queue.id)
+            return dataset_info, queue_info
+
+        # Datasets of provisioned steps are known, they aren't looked up by name.
+        if (
+            not workflow_step.state.provisioned
+            and not workflow_step.is_dataset_exists()
+        ):
+            sly.logger.debug(
+                "Workflow Step %s dataset does not exist. Cannot get labeling queue.",
+                step_number,
+            )
+            return None, None
+
+        dataset_info = g.api.dataset.get_info_by_id(workflow_step.dataset_id)
+        if workflow_step.state.provisioned:
+            if dataset_info is None:
+                # Removed since the launch, the transition copies the dataset again.
+                workflow_step.state.provisioned = False
+                return None, None
+            # An interrupted copy leaves part of the items in the dataset.
+            workflow_step.dataset_items_count = dataset_info.items_count
+        labeling_queue_info = workflow_step.get_labeling_queue()
+        return dataset_info, labeling_queue_info
+
+    def provision_downstream_steps(self) -> None:
+        """Pre-provision projects, metas and empty datasets of all steps after the first
+        one in parallel, so transitions between teams don't have to do it."""
+        if not self.project_id:
+            return
+
+        source_meta = sly.ProjectMeta.from_json(g.api.project.get_meta(self.project_id))
+        steps = []
+        for step_number, workflow_step in self.steps.items():
+            # Step meta has to contain all classes and tags labeled up to this step.
+            for sly_class in workflow_step.get_classes():
+                if not source_meta.get_obj_class(sly_class.name):
+                    source_meta = source_meta.add_obj_class(sly_class)
+            for tag_meta in workflow_step.get_tags():
+                if not source_meta.get_tag_meta(tag_meta.name):
+                    source_meta = source_meta.add_tag_meta(tag_meta)
+            if step_number > 1:
+                steps.append((workflow_step, source_meta))
+
+        sly.logger.info(f"Provisioning {len(steps)} downstream workflow steps.")
+        with ThreadPoolExecutor(max_workers=PROVISION_WORKERS) as executor:
+            futures = [
+                executor.submit(low_priority(workflow_step.provision), step_meta)
+                for workflow_step, step_meta in steps
+            ]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    sly.logger.error(f"Failed to provision workflow step: {e}")
+
+
+class Workflow(BaseWorkflow, metaclass=SingletonABCMeta):
+    def __init__(self):
+        super().__init__()
         widgets: list[Card] = []
         for step_number in range(1, g.NUMBER_OF_TEAMS + 1):
-            workflow_step = WorkflowStep(step_number)
+            workflow_step = WorkflowStep(step_number, self)
             self.steps[step_number] = workflow_step
             if workflow_step.content:
                 widgets.append(workflow_step.content)
@@ -944,6 +2056,22 @@ class Workflow(metaclass=Singleton):
             widgets=widgets,
         )
 
+    @property
+    def project_id(self) -> Optional[int]:
+        return select_project.get_selected_id()
+
+    @property
+    def dataset_id(self) -> Optional[int]:
+        if WorkflowSettings().DATASET_INFO:
+            return WorkflowSettings().DATASET_INFO.id
+        return None
+
+    def get_project_name(self) -> Optional[str]:
+        return WorkflowSettings().get_project_name()
+
+    def get_dataset_name(self) -> Optional[str]:
+        return WorkflowSettings().get_dataset_name()
+
     def all_steps_filled(self) -> bool:
         for step_number, workflow_step in self.steps.items():
             if not workflow_step.is_filled():
@@ -954,24 +2082,6 @@ class Workflow(metaclass=Singleton):
         launch_workflow_button.enable()
         return True
 
-    def all_steps_queues(
-        self,
-    ) -> List[Tuple[Optional[sly.DatasetInfo], Optional[LabelingQueueInfo]]]:
-        pairs = []
-        for step_number, workflow_step in self.steps.items():
-            dataset_exists = workflow_step.is_dataset_exists()
-            if not dataset_exists:
-                sly.logger.info(
-                    f"Workflow Step {step_number} dataset does not exist. Cannot get labeling queue."
-                )
-                pairs.append((None, None))
-                continue
-
-            dataset_info = g.api.dataset.get_info_by_id(workflow_step.dataset_id)
-            labeling_queue_info = workflow_step.get_labeling_queue()
-            pairs.append((dataset_info, labeling_queue_info))
-        return pairs
-
     def to_json(self) -> Dict[int, Dict[str, Any]]:
         data = {}
         for step_number, workflow_step in self.steps.items():
@@ -985,6 +2095,11 @@ class Workflow(metaclass=Singleton):
             if step_number in self.steps:
                 sly.logger.info(f"Loading data for Workflow Step {step_number}")
                 self.steps[step_number].update_from_json(step_data)
+        self.set_configs(data)
+
+    def refresh_state(self) -> None:
+        """Load the configuration from the step widgets into the workflow state."""
+        self.set_configs(self.to_json())
 
     def reset_workflow(self):
         sly.logger.info("Resetting workflow configuration.")
@@ -998,12 +2113,48 @@ class Workflow(metaclass=Singleton):
             workflow_step.reviewer_selector.set_value([])
             workflow_step.labeler_selector.set_value([])
             workflow_step.quality_check_selector.set_value([])
+            workflow_step.overflow_labeler_selector.set_value([])
         launch_workflow_button.disable()
 
     def get_layout(self):
         return Container(widgets=[settings_card, self._layout])
 
 
+class HeadlessWorkflow(BaseWorkflow):
+    """Workflow of a dataset launched in bulk, driven only by its saved configuration."""
+
+    def __init__(
+        self,
+        project_info: sly.ProjectInfo,
+        dataset_info: sly.DatasetInfo,
+        config: Dict[int, Dict[str, Any]],
+        meta: Optional[sly.ProjectMeta] = None,
+    ):
+        super().__init__()
+        self.project_info = project_info
+        self.dataset_info = DatasetState.from_info(dataset_info)
+        for step_number in sorted(config, key=int):
+            workflow_step = HeadlessWorkflowStep(int(step_number), self)
+            workflow_step.project_id = config[step_number].get("project_id")
+            workflow_step.dataset_id = config[step_number].get("dataset_id")
+            self.steps[int(step_number)] = workflow_step
+        self.set_configs(config, meta)
+
+    @property
+    def project_id(self) -> Optional[int]:
+        return self.project_info.id
+
+    @property
+    def dataset_id(self) -> Optional[int]:
+        return self.dataset_info.id
+
+    def get_project_name(self) -> Optional[str]:
+        return self.project_info.name
+
+    def get_dataset_name(self) -> Optional[str]:
+        return self.dataset_info.name
+
+
 if g.DATASET_ID:
     sly.logger.info(f"Setting selected dataset ID: {g.DATASET_ID}")
     select_dataset.set_dataset_id(g.DATASET_ID)
@@ -0,0 +1,74 @@
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict
+
+import src.globals as g
+
+MULTITEAM_LABELING_WORKFLOW_TITLE = "multi_team_labeling_workflow"
+MULTITEAM_LABELING_WORKFLOW_STATE_TITLE = "multi_team_labeling_workflow_state"
+MULTITEAM_LABELING_QUALITY_CHECK_TITLE = "multi_team_labeling_quality_check"
+
+_lock = threading.Lock()
+_project_locks: Dict[int, threading.Lock] = defaultdict(threading.Lock)
+
+
+def update_project_custom_data(
+    project_id: int, title: str, update_fn: Callable[[Dict[str, Any]], None]
+) -> Dict[str, Any]:
+    """Apply update_fn to the value stored under the title in the project custom data
+    and return the updated value.
+
+    All writers of the project custom data go through this function: writes to the
+    same project are serialized and the custom data is re-read right before it is
+    written, so values under the other titles are kept.
+    """
+    with _lock:
+        project_lock = _project_locks[project_id]
+    with project_lock:
+        project_custom_data = g.api.project.get_custom_data(project_id)
+        value = project_custom_data.get(title, {})
+        update_fn(value)
+        project_custom_data[title] = value
+        g.api.project.update_custom_data(project_id, project_custom_data)
+    return value
+
+
+def get_workflow_state(project_id: int, dataset_id: int) -> Dict[str, Any]:
+    """Return the persisted runtime state of the dataset's workflow."""
+    project_custom_data = g.api.project.get_custom_data(project_id)
+    workflow_states = project_custom_data.get(
+        MULTITEAM_LABELING_WORKFLOW_STATE_TITLE, {}
+    )
+    return workflow_states.get(str(dataset_id), {})
+
+
+def update_workflow_state(
+    project_id: int, dataset_id: int, updates: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Update the persisted runtime state of the dataset's workflow.
+
+    The state is kept apart from the workflow configuration, so saving
+    the configuration doesn't reset it.
+    """
+
+    workflow_states = update_workflow_states(project_id, {dataset_id: updates})
+    return workflow_states[str(dataset_id)]
+
+
+def update_workflow_states(
+    project_id: int, updates: Dict[int, Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Update the persisted runtime states of several workflows of the project in a
+    single custom data write.
+
+    Args:
+        updates: State updates by dataset ID.
+    """
+
+    def update(workflow_states: Dict[str, Any]) -> None:
+        for dataset_id, dataset_updates in updates.items():
+            workflow_states.setdefault(str(dataset_id), {}).update(dataset_updates)
+
+    return update_project_custom_data(
+        project_id, MULTITEAM_LABELING_WORKFLOW_STATE_TITLE, update
+    )
@@ -0,0 +1,437 @@
+import base64
+import json
+import os
+import struct
+import time
+import zlib
+from collections import Counter, defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+import supervisely as sly
+
+import src.globals as g
+from src.api_client import low_priority
+
+DELTA_BATCH_SIZE = 200
+DELTA_WORKERS = 4
+# Workflows whose deltas are computed at the same time, each with DELTA_WORKERS.
+DELTA_WORKFLOW_WORKERS = 2
+# Objects of the same class that overlap at least this much are the same object,
+# modified if their geometry or tags differ.
+MATCH_IOU_THRESHOLD = 0.5
+
+SNAPSHOT_FILE_NAME = "source.jsonl"
+
+# Key of the item in the dataset it was copied from (image ID or snapshot offset)
+# and image ID in the step's dataset.
+ItemPair = Tuple[int, int]
+
+
+class StepDelta:
+    """Per-class and per-tag changes made by a workflow step."""
+
+    def __init__(self, step_number: int, from_dataset_id: int, to_dataset_id: int):
+        self.step_number = step_number
+        self.from_dataset_id = from_dataset_id
+        self.to_dataset_id = to_dataset_id
+        self.items: Counter = Counter()
+        self.classes: Dict[str, Counter] = defaultdict(Counter)
+        self.tags: Dict[str, Counter] = defaultdict(Counter)
+
+    def update(self, other: "StepDelta") -> None:
+        self.items.update(other.items)
+        for class_name, counter in other.classes.items():
+            self.classes[class_name].update(counter)
+        for tag_name, counter in other.tags.items():
+            self.tags[tag_name].update(counter)
+
+    def get_totals(self) -> Dict[str, int]:
+        totals = Counter()
+        for counter in (*self.classes.values(), *self.tags.values()):
+            totals.update(
+                {key: counter[key] for key in ("added", "removed", "modified")}
+            )
+        return dict(totals)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "step": self.step_number,
+            "from_dataset_id": self.from_dataset_id,
+            "to_dataset_id": self.to_dataset_id,
+            "items": dict(self.items),
+            "totals": self.get_totals(),
+            "classes": {name: dict(counter) for name, counter in self.classes.items()},
+            "tags": {name: dict(counter) for name, counter in self.tags.items()},
+        }
+
+
+def get_bitmap_size(data: str) -> Tuple[int, int]:
+    """Return (width, height) of a bitmap from its PNG header without decoding it."""
+    png = zlib.decompressobj().decompress(base64.b64decode(data), 24)
+    return struct.unpack(">II", png[16:24])
+
+
+def get_bbox(obj: Dict[str, Any]) -> Tuple[float, float, float, float]:
+    """Return (left, top, right, bottom) of an object in the annotation JSON format."""
+    bitmap = obj.get("bitmap")
+    if bitmap:
+        left, top = bitmap["origin"]
+        width, height = get_bitmap_size(bitmap["data"])
+        return left, top, left + width, top + height
+    points = obj.get("points", {}).get("exterior")
+    if not points:
+        points = [node["loc"] for node in obj.get("nodes", {}).values()]
+    if not points:
+        return 0, 0, 0, 0
+    coords = np.asarray(points, dtype=np.float32)
+    left, top = coords.min(axis=0)
+    right, bottom = coords.max(axis=0)
+    return left, top, right, bottom
+
+
+def get_iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """IoU of every pair of boxes, (N, 4) x (M, 4) -> (N, M)."""
+    left = np.maximum(boxes_a[:, None, 0], boxes_b[None, :, 0])
+    top = np.maximum(boxes_a[:, None, 1], boxes_b[None, :, 1])
+    right = np.minimum(boxes_a[:, None, 2], boxes_b[None, :, 2])
+    bottom = np.minimum(boxes_a[:, None, 3], boxes_b[None, :, 3])
+    intersection = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.divide(
+        intersection, union, out=np.zeros_like(intersection), where=union > 0
+    )
+
+
+def get_object_signature(obj: Dict[str, Any]) -> str:
+    """Geometry and tags of an object, without IDs and timestamps that change on copy."""
+    geometry = {
+        key: obj.get(key) for key in ("geometryType", "points", "bitmap", "nodes")
+    }
+    tags = sorted((tag["name"], str(tag.get("value"))) for tag in obj.get("tags", []))
+    return json.dumps([geometry, tags], sort_keys=True)
+
+
+def count_class_changes(
+    old_objects: List[Dict[str, Any]], new_objects: List[Dict[str, Any]]
+) -> Counter:
+    """Count unchanged, modified, added and removed objects of one class.
+
+    Identical objects are paired first, the rest are matched greedily by the
+    highest bounding box IoU.
+    """
+    counter = Counter()
+    new_signatures = Counter(get_object_signature(obj) for obj in new_objects)
+    old_left = []
+    for obj in old_objects:
+        signature = get_object_signature(obj)
+        if new_signatures[signature] > 0:
+            new_signatures[signature] -= 1
+            counter["unchanged"] += 1
+        else:
+            old_left.append(obj)
+    new_left = []
+    for obj in new_objects:
+        signature = get_object_signature(obj)
+        if new_signatures[signature] > 0:
+            new_signatures[signature] -= 1
+            new_left.append(obj)
+
+    modified = 0
+    if old_left and new_left:
+        iou = get_iou_matrix(
+            np.asarray([get_bbox(obj) for obj in old_left], dtype=np.float32),
+            np.asarray([get_bbox(obj) for obj in new_left], dtype=np.float32),
+        )
+        used_old = np.zeros(len(old_left), dtype=bool)
+        used_new = np.zeros(len(new_left), dtype=bool)
+        for flat_index in np.argsort(iou, axis=None)[::-1]:
+            old_index, new_index = divmod(int(flat_index), len(new_left))
+            if iou[old_index, new_index] < MATCH_IOU_THRESHOLD:
+                break
+            if used_old[old_index] or used_new[new_index]:
+                continue
+            used_old[old_index] = used_new[new_index] = True
+            modified += 1
+
+    counter["modified"] += modified
+    counter["removed"] += len(old_left) - modified
+    counter["added"] += len(new_left) - modified
+    return counter
+
+
+def diff_annotations(
+    old_ann: Dict[str, Any],
+    new_ann: Dict[str, Any],
+    delta: StepDelta,
+    class_names: Optional[Set[str]] = None,
+    tag_names: Optional[Set[str]] = None,
+) -> None:
+    """Add the changes between two annotations of an item to the delta.
+
+    Args:
+        class_names: Compare only these classes, all if None.
+        tag_names: Compare only these image tags, all if None.
+    """
+    old_by_class = defaultdict(list)
+    new_by_class = defaultdict(list)
+    for obj in old_ann.get("objects", []):
+        old_by_class[obj["classTitle"]].append(obj)
+    for obj in new_ann.get("objects", []):
+        new_by_class[obj["classTitle"]].append(obj)
+
+    changed = False
+    for class_name in old_by_class.keys() | new_by_class.keys():
+        if class_names is not None and class_name not in class_names:
+            continue
+        counter = count_class_changes(
+            old_by_class[class_name], new_by_class[class_name]
+        )
+        delta.classes[class_name].update(counter)
+        changed = changed or counter["unchanged"] != sum(counter.values())
+
+    old_tags = defaultdict(list)
+    new_tags = defaultdict(list)
+    for tag in old_ann.get("tags", []):
+        old_tags[tag["name"]].append(str(tag.get("value")))
+    for tag in new_ann.get("tags", []):
+        new_tags[tag["name"]].append(str(tag.get("value")))
+    for tag_name in old_tags.keys() | new_tags.keys():
+        if tag_names is not None and tag_name not in tag_names:
+            continue
+        old_values = sorted(old_tags.get(tag_name, []))
+        new_values = sorted(new_tags.get(tag_name, []))
+        if old_values == new_values:
+            continue
+        change = (
+            "added" if not old_values else "removed" if not new_values else "modified"
+        )
+        delta.tags[tag_name][change] += 1
+        changed = True
+
+    delta.items["changed" if changed else "unchanged"] += 1
+
+
+def get_snapshot_path(dataset_id: int) -> str:
+    return os.path.join(g.DELTA_DIR, str(dataset_id), SNAPSHOT_FILE_NAME)
+
+
+def snapshot_annotations(dataset_id: int) -> str:
+    """Save annotations of a dataset, one JSON line per item, and return the path.
+
+    The first step labels the source dataset in place, so its changes are compared
+    with the annotations saved before its labeling queue is created.
+    """
+    path = get_snapshot_path(dataset_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    image_infos = g.api.image.get_list(dataset_id)
+    batches = [
+        image_infos[i : i + DELTA_BATCH_SIZE]
+        for i in range(0, len(image_infos), DELTA_BATCH_SIZE)
+    ]
+
+    def download_batch(batch: List[sly.ImageInfo]) -> List[Dict[str, Any]]:
+        return g.api.annotation.download_json_batch(
+            dataset_id, [image_info.id for image_info in batch]
+        )
+
+    started = time.perf_counter()
+    # Written under another name first, so an interrupted snapshot isn't used.
+    with open(path + ".tmp", "w") as f:
+        with ThreadPoolExecutor(max_workers=DELTA_WORKERS) as executor:
+            for batch, anns in zip(
+                batches, executor.map(low_priority(download_batch), batches)
+            ):
+                for image_info, ann in zip(batch, anns):
+                    record = {"name": image_info.name, "annotation": ann}
+                    f.write(json.dumps(record, separators=(",", ":")) + "\n")
+    os.replace(path + ".tmp", path)
+    sly.logger.info(
+        f"Annotations of {len(image_infos)} items of Dataset ID {dataset_id} saved "
+        f"in {time.perf_counter() - started:.1f}s to {path}"
+    )
+    return path
+
+
+class AnnotationSnapshot:
+    """Annotations saved by `snapshot_annotations`, read by line offset."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offsets: Dict[str, int] = {}
+        with open(path, "rb") as f:
+            offset = 0
+            for line in f:
+                self.offsets[json.loads(line)["name"]] = offset
+                offset += len(line)
+
+    def read(self, offsets: List[int]) -> List[Dict[str, Any]]:
+        anns = []
+        with open(self.path, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                anns.append(json.loads(f.readline())["annotation"])
+        return anns
+
+
+def get_item_pairs(
+    from_ids: Dict[str, int], to_dataset_id: int, delta: StepDelta
+) -> List[ItemPair]:
+    """Match items of the dataset a step started from, by name, with the items of
+    the step's dataset. Only IDs are kept in memory."""
+    from_ids = dict(from_ids)
+    pairs = []
+    for image_info in g.api.image.get_list(to_dataset_id):
+        from_id = from_ids.pop(image_info.name, None)
+        if from_id is None:
+            delta.items["only_in_step"] += 1
+        else:
+            pairs.append((from_id, image_info.id))
+    delta.items["only_in_previous"] += len(from_ids)
+    return pairs
+
+
+def iter_batches(pairs: List[ItemPair]) -> Iterator[List[ItemPair]]:
+    for i in range(0, len(pairs), DELTA_BATCH_SIZE):
+        yield pairs[i : i + DELTA_BATCH_SIZE]
+
+
+def compute_step_delta(
+    step_number: int,
+    from_dataset_id: int,
+    to_dataset_id: int,
+    class_names: Optional[Set[str]] = None,
+    tag_names: Optional[Set[str]] = None,
+    snapshot: Optional[AnnotationSnapshot] = None,
+) -> StepDelta:
+    """Compare annotations of matching items of a step's dataset and the dataset it
+    was copied from, or the snapshot of its annotations if the step labels it in
+    place.
+
+    Annotations are downloaded in batches, several batches at a time, and each
+    batch is reduced to counters right away, so memory doesn't grow with the
+    dataset size.
+    """
+    delta = StepDelta(step_number, from_dataset_id, to_dataset_id)
+    if snapshot is not None:
+        from_ids = snapshot.offsets
+    else:
+        from_ids = {
+            image_info.name: image_info.id
+            for image_info in g.api.image.get_list(from_dataset_id)
+        }
+    pairs = get_item_pairs(from_ids, to_dataset_id, delta)
+
+    def diff_batch(batch: List[ItemPair]) -> StepDelta:
+        batch_delta = StepDelta(step_number, from_dataset_id, to_dataset_id)
+        from_keys = [from_key for from_key, _ in batch]
+        if snapshot is not None:
+            old_anns = snapshot.read(from_keys)
+        else:
+            old_anns = g.api.annotation.download_json_batch(from_dataset_id, from_keys)
+        new_anns = g.api.annotation.download_json_batch(
+            to_dataset_id, [to_id for _, to_id in batch]
+        )
+        for old_ann, new_ann in zip(old_anns, new_anns):
+            diff_annotations(old_ann, new_ann, batch_delta, class_names, tag_names)
+        return batch_delta
+
+    with ThreadPoolExecutor(max_workers=DELTA_WORKERS) as executor:
+        for batch_delta in executor.map(low_priority(diff_batch), iter_batches(pairs)):
+            delta.update(batch_delta)
+    return delta
+
+
+def save_step_delta(dataset_id: int, delta: StepDelta) -> str:
+    """Write the summary of a step delta and return its path."""
+    delta_dir = os.path.join(g.DELTA_DIR, str(dataset_id))
+    os.makedirs(delta_dir, exist_ok=True)
+    path = os.path.join(delta_dir, f"step_{delta.step_number}.json")
+    with open(path, "w") as f:
+        json.dump(delta.to_json(), f, separators=(",", ":"))
+    return path
+
+
+class DeltaSource:
+    """Datasets to compare for a step and the classes and tags owned by it.
+
+    A step that labels the dataset it starts from in place is compared with the
+    snapshot of its annotations taken before the step started.
+    """
+
+    def __init__(
+        self,
+        step_number: int,
+        from_dataset_id: int,
+        to_dataset_id: int,
+        class_names: Optional[Set[str]] = None,
+        tag_names: Optional[Set[str]] = None,
+        snapshot_path: Optional[str] = None,
+    ):
+        self.step_number = step_number
+        self.from_dataset_id = from_dataset_id
+        self.to_dataset_id = to_dataset_id
+        self.class_names = class_names
+        self.tag_names = tag_names
+        self.snapshot_path = snapshot_path
+
+
+def compute_workflow_deltas(
+    dataset_id: int, sources: List[DeltaSource]
+) -> Dict[int, Dict[str, Any]]:
+    """Compute and save deltas of all steps of a workflow.
+
+    Returns:
+        Totals of added, removed and modified objects and tags by step number.
+        Steps labeled in place without a snapshot are marked as unavailable.
+    """
+    totals = {}
+    for source in sources:
+        started = time.perf_counter()
+        snapshot = None
+        if source.snapshot_path is not None:
+            if not os.path.exists(source.snapshot_path):
+                totals[source.step_number] = {"unavailable": True}
+                sly.logger.warning(
+                    f"Delta of Workflow Step {source.step_number} is unavailable: "
+                    "annotations of its dataset were not saved before it started."
+                )
+                continue
+            snapshot = AnnotationSnapshot(source.snapshot_path)
+        delta = compute_step_delta(
+            source.step_number,
+            source.from_dataset_id,
+            source.to_dataset_id,
+            source.class_names,
+            source.tag_names,
+            snapshot,
+        )
+        path = save_step_delta(dataset_id, delta)
+        totals[source.step_number] = delta.get_totals()
+        sly.logger.info(
+            f"Delta of Workflow Step {source.step_number} computed in "
+            f"{time.perf_counter() - started:.1f}s: {totals[source.step_number]}, "
+            f"saved to {path}"
+        )
+    return totals
+
+
+_workflow_executor = ThreadPoolExecutor(max_workers=DELTA_WORKFLOW_WORKERS)
+
+
+def submit_snapshot(dataset_id: int) -> "Future[str]":
+    """Save annotations of a dataset on a background worker."""
+    return _workflow_executor.submit(low_priority(snapshot_annotations), dataset_id)
+
+
+def submit_workflow_deltas(
+    dataset_id: int, sources: List[DeltaSource]
+) -> "Future[Dict[int, Dict[str, Any]]]":
+    """Compute and save deltas of all steps of a workflow on a background worker,
+    so the monitoring poll isn't blocked while annotations are downloaded."""
+    return _workflow_executor.submit(
+        low_priority(compute_workflow_deltas), dataset_id, sources
+    )
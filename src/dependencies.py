@@ -0,0 +1,73 @@
+from typing import Any, Dict, List, Set
+
+TAG_APPLICABLE_TO_IMAGES_ONLY = "imagesOnly"
+
+
+class StepLabels:
+    """Classes and tags labeled in a workflow step, read from its saved config."""
+
+    def __init__(self, step_config: Dict[str, Any]):
+        self.class_names: Set[str] = {
+            cls_json["title"] for cls_json in step_config.get("selected_classes", [])
+        }
+        self.tag_names: Set[str] = {
+            tag_json["name"] for tag_json in step_config.get("selected_tags", [])
+        }
+        self.object_tags = [
+            tag_json
+            for tag_json in step_config.get("selected_tags", [])
+            if tag_json.get("applicable_type") != TAG_APPLICABLE_TO_IMAGES_ONLY
+        ]
+
+    def is_empty(self) -> bool:
+        return not self.class_names and not self.tag_names
+
+    def tags_target_other_classes(self) -> bool:
+        """Check whether object tags of this step can be put on objects of classes
+        not labeled in this step. A merge keeps only the objects of the step's own
+        classes, so such tags would be lost."""
+        for tag_json in self.object_tags:
+            applicable_classes = set(tag_json.get("classes", []))
+            # An empty list means that the tag is applicable to all classes.
+            if not applicable_classes or applicable_classes - self.class_names:
+                return True
+        return False
+
+
+def are_independent(first: StepLabels, second: StepLabels) -> bool:
+    """Check whether two steps can be labeled at the same time on copies of the
+    same source: their classes and tags are disjoint and neither puts object tags
+    on objects of classes it doesn't label itself, e.g. the other step's ones."""
+    if first.is_empty() or second.is_empty():
+        return False
+    if first.class_names & second.class_names:
+        return False
+    if first.tag_names & second.tag_names:
+        return False
+    if first.tags_target_other_classes() or second.tags_target_other_classes():
+        return False
+    return True
+
+
+def get_parallel_stages(step_configs: Dict[int, Dict[str, Any]]) -> List[List[int]]:
+    """Group consecutive workflow steps into stages of mutually independent steps.
+
+    Steps of a stage run at the same time, stages run one after another.
+
+    Returns:
+        List of stages, each one is a list of step numbers.
+    """
+    step_labels = {
+        int(step_number): StepLabels(step_config)
+        for step_number, step_config in step_configs.items()
+    }
+    stages: List[List[int]] = []
+    for step_number in sorted(step_labels):
+        if stages and all(
+            are_independent(step_labels[step_number], step_labels[other])
+            for other in stages[-1]
+        ):
+            stages[-1].append(step_number)
+        else:
+            stages.append([step_number])
+    return stages
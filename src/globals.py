@@ -1,15 +1,45 @@
 import os
 import shutil
+import socket
 
 import supervisely as sly
 
 from dotenv import load_dotenv
 
+from src.api_client import ApiClient
+from src.replay import ApiRecorder
+
 if sly.is_development():
     load_dotenv("local.env")
     load_dotenv(os.path.expanduser("~/supervisely.env"))
 
-api = sly.Api.from_env(ignore_task_id=True)
+# Shared API client: rate limit (requests per second) with burst size,
+# number of concurrent requests, retries and share of requests that may be retried.
+API_RATE_LIMIT = float(os.environ.get("API_RATE_LIMIT") or 10)
+API_BURST = int(os.environ.get("API_BURST") or 20)
+API_POOL_SIZE = int(os.environ.get("API_POOL_SIZE") or 8)
+API_MAX_RETRIES = int(os.environ.get("API_MAX_RETRIES") or 3)
+API_RETRY_BUDGET_RATIO = float(os.environ.get("API_RETRY_BUDGET_RATIO") or 0.1)
+
+# Directory for trace spans and monitoring profiles.
+TRACE_DIR = os.environ.get("TRACE_DIR") or os.path.join(
+    sly.app.get_data_dir(), "traces"
+)
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "true").lower() in ("1", "true")
+
+# File to record all API calls to, for offline replay with `python -m src.replay`.
+API_RECORD_PATH = os.environ.get("API_RECORD_PATH")
+
+api = ApiClient(
+    rate=API_RATE_LIMIT,
+    burst=API_BURST,
+    pool_size=API_POOL_SIZE,
+    max_retries=API_MAX_RETRIES,
+    retry_budget_ratio=API_RETRY_BUDGET_RATIO,
+).install(sly.Api.from_env(ignore_task_id=True))
+if API_RECORD_PATH:
+    sly.logger.info(f"Recording API calls to {API_RECORD_PATH}")
+    api = ApiRecorder(api, API_RECORD_PATH)
 
 TEAM_ID = sly.env.team_id()
 WORKSPACE_ID = sly.env.workspace_id()
@@ -26,3 +56,87 @@ if not number_of_teams:
     raise ValueError("Environment variable 'modal.state.numberOfTeams' is not set.")
 NUMBER_OF_TEAMS = int(number_of_teams)
 sly.logger.info(f"Number of teams: {NUMBER_OF_TEAMS}")
+
+# Backlog size (untouched queue items) after which a step gets an overflow queue.
+# 0 disables rebalancing.
+REBALANCE_BACKLOG_THRESHOLD = int(
+    os.environ.get("modal.state.rebalanceBacklogThreshold") or 0
+)
+sly.logger.info(f"Rebalance backlog threshold: {REBALANCE_BACKLOG_THRESHOLD}")
+
+# Fraction of items that go through quality check, escalated to 1.0 when the
+# rejection rate exceeds the threshold.
+QUALITY_CHECK_SAMPLE_FRACTION = min(
+    max(float(os.environ.get("modal.state.qualityCheckSampleFraction") or 1.0), 0.01),
+    1.0,
+)
+QUALITY_CHECK_STRATIFIED = os.environ.get(
+    "modal.state.qualityCheckStratified", ""
+).lower() in ("1", "true")
+QUALITY_CHECK_ESCALATION_THRESHOLD = float(
+    os.environ.get("modal.state.qualityCheckEscalationThreshold") or 0.1
+)
+sly.logger.info(
+    f"Quality check sample fraction: {QUALITY_CHECK_SAMPLE_FRACTION}, "
+    f"stratified: {QUALITY_CHECK_STRATIFIED}, "
+    f"escalation threshold: {QUALITY_CHECK_ESCALATION_THRESHOLD}"
+)
+
+# Run consecutive steps with disjoint classes and tags at the same time.
+PARALLEL_INDEPENDENT_STEPS = os.environ.get(
+    "modal.state.parallelIndependentSteps", ""
+).lower() in ("1", "true")
+sly.logger.info(f"Parallel independent steps: {PARALLEL_INDEPENDENT_STEPS}")
+
+# Write annotations of the last step back to the source dataset when all steps are done.
+WRITE_BACK_RESULTS = os.environ.get("modal.state.writeBackResults", "").lower() in (
+    "1",
+    "true",
+)
+sly.logger.info(f"Write back results: {WRITE_BACK_RESULTS}")
+
+# Compare every step's dataset with the one it started from when the workflow is
+# finished and save per-class and per-tag changes to DELTA_DIR.
+COMPUTE_STEP_DELTAS = os.environ.get("modal.state.computeStepDeltas", "").lower() in (
+    "1",
+    "true",
+)
+DELTA_DIR = os.environ.get("DELTA_DIR") or os.path.join(
+    sly.app.get_data_dir(), "deltas"
+)
+sly.logger.info(f"Compute step deltas: {COMPUTE_STEP_DELTAS}")
+
+# Remove datasets of the intermediate steps of finished workflows, except the
+# datasets of the last steps. Dry run only logs what would be removed.
+RECLAIM_STEP_DATASETS = os.environ.get(
+    "modal.state.reclaimStepDatasets", ""
+).lower() in ("1", "true")
+RECLAIM_KEEP_LAST = max(int(os.environ.get("modal.state.reclaimKeepLast") or 1), 0)
+RECLAIM_DRY_RUN = os.environ.get("modal.state.reclaimDryRun", "").lower() in (
+    "1",
+    "true",
+)
+sly.logger.info(
+    f"Reclaim step datasets: {RECLAIM_STEP_DATASETS}, "
+    f"keep last: {RECLAIM_KEEP_LAST}, dry run: {RECLAIM_DRY_RUN}"
+)
+
+# Workflow ownership between app instances: each workflow is processed only by
+# the instance holding its lease. Leases are kept in the custom data of the workflow
+# datasets ("custom_data") or in a directory shared by the instances ("local").
+INSTANCE_ID = os.environ.get("INSTANCE_ID") or (
+    f"{os.environ.get('TASK_ID') or socket.gethostname()}-{os.getpid()}"
+)
+LEASE_STORE = os.environ.get("LEASE_STORE") or "custom_data"
+LEASE_DIR = os.environ.get("LEASE_DIR") or os.path.join(
+    sly.app.get_data_dir(), "leases"
+)
+if LEASE_STORE == "local" and not os.environ.get("LEASE_DIR"):
+    sly.logger.warning(
+        f"Leases are kept in {LEASE_DIR}, which is not shared with other instances. "
+        "Set LEASE_DIR to a shared directory or use LEASE_STORE=custom_data."
+    )
+LEASE_TTL = int(os.environ.get("LEASE_TTL") or 60)
+sly.logger.info(
+    f"Instance ID: {INSTANCE_ID}, lease store: {LEASE_STORE}, lease TTL: {LEASE_TTL}s"
+)
@@ -0,0 +1,307 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Tuple
+
+import supervisely as sly
+from supervisely.app.singleton import Singleton
+
+import src.globals as g
+
+MULTITEAM_LABELING_WORKFLOW_LEASES_TITLE = "multi_team_labeling_workflow_lease"
+LEASE_FILE_NAME = "leases.json"
+
+# Custom data has no compare-and-swap, so a new claim is confirmed by a later poll
+# made at least this many seconds after it, when a concurrent claim by another
+# instance would have been written.
+CLAIM_SETTLE_DELAY = 2
+# Leases are renewed when this share of the TTL has passed.
+RENEW_FRACTION = 1 / 3
+
+WorkflowKey = Tuple[int, int]
+
+
+class LeaseStore(ABC):
+    """Storage of workflow leases: `{owner, expires_at}` per (project, dataset)."""
+
+    # False if a claim can be overwritten by a concurrent claim and must be read
+    # back before it is relied on.
+    atomic = True
+
+    @abstractmethod
+    def acquire(self, project_id: int, dataset_id: int, owner: str, ttl: int) -> bool:
+        """Claim or renew the lease. Returns False if another owner holds it."""
+
+    @abstractmethod
+    def release(self, project_id: int, dataset_id: int, owner: str) -> None:
+        pass
+
+    @abstractmethod
+    def get(self, project_id: int, dataset_id: int) -> Optional[Dict[str, Any]]:
+        pass
+
+
+def is_held_by_other(lease: Optional[Dict[str, Any]], owner: str) -> bool:
+    return bool(lease) and lease["owner"] != owner and lease["expires_at"] > time.time()
+
+
+def is_held_by(lease: Optional[Dict[str, Any]], owner: str) -> bool:
+    return bool(lease) and lease["owner"] == owner and lease["expires_at"] > time.time()
+
+
+class CustomDataLeaseStore(LeaseStore):
+    """Leases kept in the custom data of the workflow datasets, visible to instances
+    on any host. Each lease is written to its own dataset, so claims and renewals
+    never rewrite the project custom data with the workflow configs and states."""
+
+    atomic = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _get_custom_data(dataset_id: int) -> Dict[str, Any]:
+        return g.api.dataset.get_info_by_id(dataset_id).custom_data or {}
+
+    def _set_lease(self, dataset_id: int, lease: Optional[Dict[str, Any]]) -> None:
+        # Re-read right before writing to keep the other keys of the dataset.
+        custom_data = self._get_custom_data(dataset_id)
+        if lease is None:
+            custom_data.pop(MULTITEAM_LABELING_WORKFLOW_LEASES_TITLE, None)
+        else:
+            custom_data[MULTITEAM_LABELING_WORKFLOW_LEASES_TITLE] = lease
+        g.api.dataset.update_custom_data(dataset_id, custom_data)
+
+    def acquire(self, project_id: int, dataset_id: int, owner: str, ttl: int) -> bool:
+        with self._lock:
+            if is_held_by_other(self.get(project_id, dataset_id), owner):
+                return False
+            self._set_lease(
+                dataset_id, {"owner": owner, "expires_at": time.time() + ttl}
+            )
+            return True
+
+    def release(self, project_id: int, dataset_id: int, owner: str) -> None:
+        with self._lock:
+            lease = self.get(project_id, dataset_id)
+            if lease and lease["owner"] == owner:
+                self._set_lease(dataset_id, None)
+
+    def get(self, project_id: int, dataset_id: int) -> Optional[Dict[str, Any]]:
+        return self._get_custom_data(dataset_id).get(
+            MULTITEAM_LABELING_WORKFLOW_LEASES_TITLE
+        )
+
+
+class LocalLeaseStore(LeaseStore):
+    """Leases kept in a file guarded by a file lock, for instances sharing a volume."""
+
+    def __init__(self, lease_dir: str):
+        os.makedirs(lease_dir, exist_ok=True)
+        self.path = os.path.join(lease_dir, LEASE_FILE_NAME)
+        self._lock_path = f"{self.path}.lock"
+
+    def _update(self, update) -> Any:
+        with open(self._lock_path, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                leases = {}
+                if os.path.exists(self.path):
+                    with open(self.path) as f:
+                        leases = json.load(f)
+                result = update(leases)
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(leases, f)
+                os.replace(tmp_path, self.path)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _key(project_id: int, dataset_id: int) -> str:
+        return f"{project_id}/{dataset_id}"
+
+    def acquire(self, project_id: int, dataset_id: int, owner: str, ttl: int) -> bool:
+        key = self._key(project_id, dataset_id)
+
+        def claim(leases: Dict[str, Any]) -> bool:
+            if is_held_by_other(leases.get(key), owner):
+                return False
+            leases[key] = {"owner": owner, "expires_at": time.time() + ttl}
+            return True
+
+        return self._update(claim)
+
+    def release(self, project_id: int, dataset_id: int, owner: str) -> None:
+        key = self._key(project_id, dataset_id)
+
+        def remove(leases: Dict[str, Any]) -> None:
+            if leases.get(key, {}).get("owner") == owner:
+                del leases[key]
+
+        self._update(remove)
+
+    def get(self, project_id: int, dataset_id: int) -> Optional[Dict[str, Any]]:
+        return self._update(
+            lambda leases: leases.get(self._key(project_id, dataset_id))
+        )
+
+
+def get_lease_store() -> LeaseStore:
+    if g.LEASE_STORE == "local":
+        return LocalLeaseStore(g.LEASE_DIR)
+    if g.LEASE_STORE == "custom_data":
+        return CustomDataLeaseStore()
+    raise ValueError(f"Unknown lease store: {g.LEASE_STORE}")
+
+
+class LeaseManager(metaclass=Singleton):
+    """Leases of the workflows processed by this instance.
+
+    A workflow is processed only while its lease is held. Held leases are renewed
+    by a heartbeat thread, so a long transition doesn't let the lease expire. When
+    an instance stops renewing, its leases expire after the TTL and other instances
+    take the workflows over on their next poll.
+    """
+
+    def __init__(self):
+        self.store = get_lease_store()
+        self.owner = g.INSTANCE_ID
+        self.ttl = g.LEASE_TTL
+        self._lock = threading.Lock()
+        # Lease expiration time by the local monotonic clock.
+        self._held: Dict[WorkflowKey, float] = {}
+        # Claims waiting for confirmation, by the local monotonic time of the claim.
+        self._claims: Dict[WorkflowKey, float] = {}
+        self._heartbeat_thread: Optional[threading.Thread] = None
+
+    def hold(self, project_id: int, dataset_id: int) -> bool:
+        """Return True if this instance holds the workflow lease, claiming it if free.
+
+        With a store that isn't atomic, a new claim is confirmed by a call made at
+        least CLAIM_SETTLE_DELAY seconds later; until then the lease isn't held.
+        """
+        key = (project_id, dataset_id)
+        with self._lock:
+            if self._held.get(key, 0) > time.monotonic():
+                return True
+            renewal = key in self._held
+            claimed_at = self._claims.pop(key, None)
+
+        if (
+            claimed_at is not None
+            and time.monotonic() - claimed_at < CLAIM_SETTLE_DELAY
+        ):
+            with self._lock:
+                self._claims[key] = claimed_at
+            return False
+
+        try:
+            if claimed_at is not None:
+                lease = self.store.get(project_id, dataset_id)
+                acquired = is_held_by(lease, self.owner)
+            else:
+                acquired = self.store.acquire(
+                    project_id, dataset_id, self.owner, self.ttl
+                )
+                if acquired and not self.store.atomic and not renewal:
+                    with self._lock:
+                        self._claims[key] = time.monotonic()
+                    return False
+        except Exception as e:
+            sly.logger.warning(f"Failed to claim lease of Dataset ID {dataset_id}: {e}")
+            acquired = False
+
+        with self._lock:
+            if not acquired:
+                self._held.pop(key, None)
+                return False
+            if key not in self._held:
+                sly.logger.info(f"Lease of Dataset ID {dataset_id} acquired.")
+            self._held[key] = self._get_local_expiration(claimed_at)
+        self._start_heartbeat()
+        return True
+
+    def is_claiming(self, project_id: int, dataset_id: int) -> bool:
+        """Return True if the lease is claimed and waits for confirmation."""
+        with self._lock:
+            return (project_id, dataset_id) in self._claims
+
+    def release(self, project_id: int, dataset_id: int) -> None:
+        key = (project_id, dataset_id)
+        with self._lock:
+            held = self._held.pop(key, None)
+            claimed_at = self._claims.pop(key, None)
+            if held is None and claimed_at is None:
+                return
+        try:
+            self.store.release(project_id, dataset_id, self.owner)
+            sly.logger.info(f"Lease of Dataset ID {dataset_id} released.")
+        except Exception as e:
+            sly.logger.warning(
+                f"Failed to release lease of Dataset ID {dataset_id}: {e}"
+            )
+
+    def release_all(self) -> None:
+        with self._lock:
+            keys = list(self._held)
+        for project_id, dataset_id in keys:
+            self.release(project_id, dataset_id)
+
+    def get_owner(self, project_id: int, dataset_id: int) -> Optional[str]:
+        lease = self.store.get(project_id, dataset_id)
+        if not lease or lease["expires_at"] <= time.time():
+            return None
+        return lease["owner"]
+
+    def _get_local_expiration(self, written_at: Optional[float] = None) -> float:
+        # Stop relying on a lease a bit before other instances consider it expired.
+        if written_at is None:
+            written_at = time.monotonic()
+        return written_at + self.ttl * (1 - RENEW_FRACTION)
+
+    def _start_heartbeat(self) -> None:
+        with self._lock:
+            if self._heartbeat_thread and self._heartbeat_thread.is_alive():
+                return
+            self._heartbeat_thread = threading.Thread(
+                target=self._heartbeat_loop, daemon=True
+            )
+            self._heartbeat_thread.start()
+
+    def _heartbeat_loop(self) -> None:
+        interval = max(self.ttl * RENEW_FRACTION, 1)
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                keys = list(self._held)
+            if not keys:
+                return
+            for project_id, dataset_id in keys:
+                self._renew(project_id, dataset_id)
+
+    def _renew(self, project_id: int, dataset_id: int) -> None:
+        key = (project_id, dataset_id)
+        try:
+            renewed = self.store.acquire(project_id, dataset_id, self.owner, self.ttl)
+        except Exception as e:
+            # Keep the lease until it expires locally, the next heartbeat retries.
+            sly.logger.warning(f"Failed to renew lease of Dataset ID {dataset_id}: {e}")
+            return
+
+        with self._lock:
+            released = key not in self._held
+            if renewed and not released:
+                self._held[key] = self._get_local_expiration()
+            elif not released:
+                del self._held[key]
+                sly.logger.warning(
+                    f"Lease of Dataset ID {dataset_id} was taken over by another instance."
+                )
+        if renewed and released:
+            # Released while renewing, don't leave the renewed lease behind.
+            self.store.release(project_id, dataset_id, self.owner)
@@ -1,8 +1,35 @@
 import supervisely as sly
 import src.globals as g
 
-from src.content import Workflow
+from src.content import Workflow, WorkflowMonitor
+from src.tracing import PollProfiler
 
 layout = Workflow().get_layout()
 
 app = sly.Application(layout=layout)
+
+server = app.get_server()
+
+
+@server.on_event("startup")
+def take_over_workflows():
+    """Take over the launched workflows of the project, e.g. after a restart or when
+    another instance stops."""
+    WorkflowMonitor().discover_workflows()
+    if WorkflowMonitor().workflows:
+        WorkflowMonitor().start()
+
+
+@server.post("/profile")
+def profile_monitoring(polls: int = 5, every: int = 1):
+    """Capture cProfile stats of the next monitoring polls."""
+    PollProfiler().request(polls, every)
+    return {"polls": polls, "every": every, "trace_dir": g.TRACE_DIR}
+
+
+@server.get("/profile")
+def get_profile_report():
+    return {
+        "active": PollProfiler().active,
+        "last_report": PollProfiler().last_report_path,
+    }
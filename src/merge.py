@@ -0,0 +1,113 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Set
+
+import supervisely as sly
+
+import src.globals as g
+from src.api_client import low_priority
+
+MERGE_BATCH_SIZE = 50
+MERGE_WORKERS = 4
+
+
+class MergeSource:
+    """Dataset of a parallel step and the classes and tags labeled in it."""
+
+    def __init__(
+        self,
+        project_id: int,
+        dataset_id: int,
+        class_names: Set[str],
+        tag_names: Set[str],
+    ):
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+        self.class_names = class_names
+        self.tag_names = tag_names
+
+
+def merge_annotations(
+    target: sly.Annotation, source: sly.Annotation, merge_source: MergeSource
+) -> sly.Annotation:
+    """Replace the objects and image tags owned by the source step in the target
+    annotation with the ones from the source annotation.
+
+    The result doesn't depend on what the target already contains for the source
+    step, so merging again gives the same annotation.
+    """
+    labels = [
+        label
+        for label in target.labels
+        if label.obj_class.name not in merge_source.class_names
+    ]
+    labels.extend(
+        label
+        for label in source.labels
+        if label.obj_class.name in merge_source.class_names
+    )
+    img_tags = [
+        tag for tag in target.img_tags if tag.meta.name not in merge_source.tag_names
+    ]
+    img_tags.extend(
+        tag for tag in source.img_tags if tag.meta.name in merge_source.tag_names
+    )
+    return target.clone(labels=labels, img_tags=sly.TagCollection(img_tags))
+
+
+def merge_stage_datasets(
+    target_project_id: int, target_dataset_id: int, sources: List[MergeSource]
+) -> None:
+    """Merge annotations of parallel steps into the dataset of the stage's last step.
+
+    Items are matched by name. Annotations are downloaded and uploaded in batches,
+    several batches at a time.
+    """
+    target_meta = sly.ProjectMeta.from_json(g.api.project.get_meta(target_project_id))
+    for merge_source in sources:
+        source_meta = sly.ProjectMeta.from_json(
+            g.api.project.get_meta(merge_source.project_id)
+        )
+        target_meta = target_meta.merge(source_meta)
+    g.api.project.update_meta(target_project_id, target_meta.to_json())
+
+    target_ids: Dict[str, int] = {
+        image_info.name: image_info.id
+        for image_info in g.api.image.get_list(target_dataset_id)
+    }
+
+    for merge_source in sources:
+        source_infos = [
+            image_info
+            for image_info in g.api.image.get_list(merge_source.dataset_id)
+            if image_info.name in target_ids
+        ]
+        batches = [
+            source_infos[i : i + MERGE_BATCH_SIZE]
+            for i in range(0, len(source_infos), MERGE_BATCH_SIZE)
+        ]
+        sly.logger.info(
+            f"Merging {len(source_infos)} items from Dataset ID {merge_source.dataset_id} "
+            f"into Dataset ID {target_dataset_id} in {len(batches)} batches."
+        )
+
+        def merge_batch(batch: List[sly.ImageInfo]) -> None:
+            source_ids = [image_info.id for image_info in batch]
+            batch_target_ids = [target_ids[image_info.name] for image_info in batch]
+            source_jsons = g.api.annotation.download_json_batch(
+                merge_source.dataset_id, source_ids
+            )
+            target_jsons = g.api.annotation.download_json_batch(
+                target_dataset_id, batch_target_ids
+            )
+            anns = [
+                merge_annotations(
+                    sly.Annotation.from_json(target_json, target_meta),
+                    sly.Annotation.from_json(source_json, target_meta),
+                    merge_source,
+                )
+                for source_json, target_json in zip(source_jsons, target_jsons)
+            ]
+            g.api.annotation.upload_anns(batch_target_ids, anns)
+
+        with ThreadPoolExecutor(max_workers=MERGE_WORKERS) as executor:
+            list(executor.map(low_priority(merge_batch), batches))
@@ -0,0 +1,261 @@
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+
+import supervisely as sly
+
+import src.globals as g
+
+PREFLIGHT_WORKERS = 8
+
+ERROR = "error"
+WARNING = "warning"
+
+
+class PreflightIssue:
+    def __init__(self, step_number: Optional[int], severity: str, message: str):
+        self.step_number = step_number
+        self.severity = severity
+        self.message = message
+
+    def __str__(self) -> str:
+        prefix = f"Step {self.step_number}" if self.step_number else "Workflow"
+        return f"{prefix}: {self.message}"
+
+
+class PreflightReport:
+    """All problems found by the preflight checks of a workflow."""
+
+    def __init__(self, issues: List[PreflightIssue]):
+        self.issues = sorted(issues, key=lambda issue: issue.step_number or 0)
+
+    @property
+    def errors(self) -> List[PreflightIssue]:
+        return [issue for issue in self.issues if issue.severity == ERROR]
+
+    @property
+    def warnings(self) -> List[PreflightIssue]:
+        return [issue for issue in self.issues if issue.severity == WARNING]
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def to_text(self) -> str:
+        lines = [f"Error. {issue}" for issue in self.errors]
+        lines.extend(f"Warning. {issue}" for issue in self.warnings)
+        return "\n".join(lines)
+
+
+class TeamMembers:
+    """Member IDs of teams, each team is requested once."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._team_locks: Dict[int, threading.Lock] = defaultdict(threading.Lock)
+        self._members: Dict[int, Set[int]] = {}
+
+    def get(self, team_id: int) -> Set[int]:
+        with self._lock:
+            team_lock = self._team_locks[team_id]
+        with team_lock:
+            if team_id not in self._members:
+                team_members = g.api.user.get_team_members(team_id)
+                self._members[team_id] = {user.id for user in team_members}
+            return self._members[team_id]
+
+
+def check_step(workflow_step, team_members: TeamMembers) -> List[PreflightIssue]:
+    """Check workspace access, user membership and name collisions of a step."""
+    step_number = workflow_step.step_number
+    issues: List[PreflightIssue] = []
+
+    def add(severity: str, message: str) -> None:
+        issues.append(PreflightIssue(step_number, severity, message))
+
+    team_id = workflow_step.config.team_id
+    workspace_id = workflow_step.config.workspace_id
+    if not team_id or not workspace_id:
+        add(ERROR, "team or workspace is not selected.")
+        return issues
+
+    if not workflow_step.config.labeler_ids or not workflow_step.config.reviewer_ids:
+        add(ERROR, "labelers and reviewers are required to create the labeling queue.")
+    if not workflow_step.config.quality_check_ids:
+        add(ERROR, "quality check users are required to create the labeling queue.")
+
+    workspace_info = g.api.workspace.get_info_by_id(workspace_id)
+    if workspace_info is None:
+        add(ERROR, f"workspace ID {workspace_id} doesn't exist or isn't accessible.")
+        return issues
+    if workspace_info.team_id != team_id:
+        add(
+            ERROR,
+            f"workspace {workspace_info.name} doesn't belong to team ID {team_id}.",
+        )
+
+    members = team_members.get(team_id)
+    roles = {
+        "labeler": workflow_step.config.labeler_ids,
+        "reviewer": workflow_step.config.reviewer_ids,
+        "quality check user": workflow_step.config.quality_check_ids,
+        "overflow labeler": workflow_step.config.overflow_labeler_ids,
+    }
+    for role, user_ids in roles.items():
+        missing_ids = sorted(set(user_ids) - members)
+        if missing_ids:
+            add(
+                ERROR, f"{role} IDs {missing_ids} are not members of team ID {team_id}."
+            )
+
+    # Steps look up a project and a dataset named after the source in their workspace.
+    project_name = workflow_step.workflow.get_project_name()
+    dataset_name = workflow_step.workflow.get_dataset_name()
+    project_info = g.api.project.get_info_by_name(workspace_id, project_name)
+
+    # The first step labels the source dataset in place.
+    if step_number == 1:
+        if project_info is None or project_info.id != workflow_step.workflow.project_id:
+            add(
+                ERROR,
+                f"workspace {workspace_info.name} doesn't contain the source project "
+                f"{project_name}, the step would never get a labeling queue or would "
+                "label another project.",
+            )
+            return issues
+        dataset_info = g.api.dataset.get_info_by_name(project_info.id, dataset_name)
+        if dataset_info is None or dataset_info.id != workflow_step.workflow.dataset_id:
+            add(
+                ERROR,
+                f"source project {project_name} doesn't contain the source dataset "
+                f"{dataset_name} at the top level.",
+            )
+        return issues
+
+    # Downstream steps get or create the project and the dataset.
+    if project_info is None:
+        return issues
+    if project_info.id == workflow_step.workflow.project_id:
+        add(
+            ERROR, "its workspace contains the source project, the step would label it."
+        )
+        return issues
+    if project_info.type != sly.ProjectType.IMAGES.value:
+        add(
+            ERROR,
+            f"project {project_name} already exists in workspace {workspace_info.name} "
+            f"and is not an images project.",
+        )
+        return issues
+    dataset_info = g.api.dataset.get_info_by_name(project_info.id, dataset_name)
+    if dataset_info and dataset_info.items_count and workflow_step.dataset_id is None:
+        add(
+            WARNING,
+            f"dataset {project_name}/{dataset_name} already exists in workspace "
+            f"{workspace_info.name} with {dataset_info.items_count} items, "
+            "it will be reused by the step.",
+        )
+    return issues
+
+
+def check_meta_compatibility(
+    workflow, source_meta: sly.ProjectMeta
+) -> List[PreflightIssue]:
+    """Check that classes and tags of the steps don't conflict with the source meta
+    and each other: the step projects get all of them merged, step by step."""
+    issues: List[PreflightIssue] = []
+    meta = source_meta
+    for step_number, workflow_step in sorted(workflow.steps.items()):
+        for sly_class in workflow_step.get_classes():
+            existing = meta.get_obj_class(sly_class.name)
+            if existing is None:
+                meta = meta.add_obj_class(sly_class)
+            elif existing.geometry_type != sly_class.geometry_type:
+                issues.append(
+                    PreflightIssue(
+                        step_number,
+                        ERROR,
+                        f"class {sly_class.name} has shape "
+                        f"{sly_class.geometry_type.geometry_name()}, but the project "
+                        f"already has it as {existing.geometry_type.geometry_name()}.",
+                    )
+                )
+        for tag_meta in workflow_step.get_tags():
+            existing = meta.get_tag_meta(tag_meta.name)
+            if existing is None:
+                meta = meta.add_tag_meta(tag_meta)
+            elif existing.value_type != tag_meta.value_type or set(
+                existing.possible_values or []
+            ) != set(tag_meta.possible_values or []):
+                issues.append(
+                    PreflightIssue(
+                        step_number,
+                        ERROR,
+                        f"tag {tag_meta.name} has value type {tag_meta.value_type}, "
+                        f"but the project already has it with value type "
+                        f"{existing.value_type} or other possible values.",
+                    )
+                )
+    return issues
+
+
+def check_workspace_collisions(workflow) -> List[PreflightIssue]:
+    """Steps in the same workspace would share one project and dataset."""
+    issues = []
+    step_by_workspace: Dict[int, int] = {}
+    for step_number, workflow_step in sorted(workflow.steps.items()):
+        workspace_id = workflow_step.config.workspace_id
+        if not workspace_id:
+            continue
+        if workspace_id in step_by_workspace:
+            issues.append(
+                PreflightIssue(
+                    step_number,
+                    ERROR,
+                    f"uses the same workspace as step {step_by_workspace[workspace_id]}, "
+                    "both steps would label the same dataset.",
+                )
+            )
+        else:
+            step_by_workspace[workspace_id] = step_number
+    return issues
+
+
+def run_preflight(
+    workflow, team_members: Optional[TeamMembers] = None
+) -> PreflightReport:
+    """Check all steps of the workflow concurrently before it's launched and return
+    every problem found, so they can be fixed in one round.
+
+    Args:
+        workflow: Workflow to check.
+        team_members: Member lists shared between the checks of several workflows.
+    """
+    if not workflow.project_id or not workflow.dataset_id:
+        return PreflightReport(
+            [PreflightIssue(None, ERROR, "project or dataset is not selected.")]
+        )
+
+    issues = check_workspace_collisions(workflow)
+    team_members = team_members or TeamMembers()
+    with ThreadPoolExecutor(max_workers=PREFLIGHT_WORKERS) as executor:
+        meta_future = executor.submit(g.api.project.get_meta, workflow.project_id)
+        step_futures = {
+            step_number: executor.submit(check_step, workflow_step, team_members)
+            for step_number, workflow_step in workflow.steps.items()
+        }
+        for step_number, future in step_futures.items():
+            try:
+                issues.extend(future.result())
+            except Exception as e:
+                issues.append(PreflightIssue(step_number, ERROR, f"check failed: {e}"))
+        source_meta = sly.ProjectMeta.from_json(meta_future.result())
+
+    issues.extend(check_meta_compatibility(workflow, source_meta))
+    report = PreflightReport(issues)
+    sly.logger.info(
+        f"Preflight of Dataset ID {workflow.dataset_id}: {len(report.errors)} errors, "
+        f"{len(report.warnings)} warnings."
+    )
+    return report
@@ -0,0 +1,178 @@
+import math
+import random
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set
+
+import supervisely as sly
+from supervisely.api.labeling_queue_api import LabelingQueueInfo
+
+import src.globals as g
+from src.custom_data import (
+    MULTITEAM_LABELING_QUALITY_CHECK_TITLE,
+    update_project_custom_data,
+)
+from src.rebalancer import get_pending_image_ids
+from src.state import StepState
+from src.utils import AUXILIARY_QUEUE_SEPARATOR, get_queue_progress
+
+NO_QUALITY_CHECK_QUEUE_KIND = "NoQC"
+ESCALATED_QUEUE_KIND = "QC"
+MIN_REVIEWED_ITEMS_FOR_ESCALATION = 20
+SAMPLE_SEED = 42
+
+# Teams whose items all go through quality check, shared by all workflows.
+_lock = threading.Lock()
+_escalated_team_ids: Set[int] = set()
+
+
+def get_image_strata(
+    dataset_id: int, image_ids: List[int], class_names: List[str]
+) -> Dict[int, str]:
+    """Group images by the set of the given classes already present on them."""
+    selected = set(class_names)
+    strata = {}
+    for ann_info in g.api.annotation.get_list(dataset_id):
+        titles = {
+            label.get("classTitle")
+            for label in ann_info.annotation.get("objects", [])
+            if label.get("classTitle") in selected
+        }
+        strata[ann_info.image_id] = ",".join(sorted(titles))
+    return {image_id: strata.get(image_id, "") for image_id in image_ids}
+
+
+def sample_image_ids(
+    image_ids: List[int],
+    fraction: float,
+    strata: Optional[Dict[int, str]] = None,
+) -> List[int]:
+    """Return a reproducible sample of the images, at least one per stratum."""
+    groups = defaultdict(list)
+    for image_id in sorted(image_ids):
+        groups[strata.get(image_id, "") if strata else ""].append(image_id)
+
+    rng = random.Random(SAMPLE_SEED)
+    sample = []
+    for stratum in sorted(groups):
+        group = groups[stratum]
+        size = min(max(math.ceil(len(group) * fraction), 1), len(group))
+        sample.extend(rng.sample(group, size))
+    return sorted(sample)
+
+
+def load_escalated_teams(project_custom_data: Dict[str, Any]) -> None:
+    """Load the teams escalated by the workflows of a project."""
+    data = project_custom_data.get(MULTITEAM_LABELING_QUALITY_CHECK_TITLE, {})
+    with _lock:
+        _escalated_team_ids.update(data.get("escalated_team_ids", []))
+
+
+def is_team_escalated(team_id: Optional[int]) -> bool:
+    with _lock:
+        return team_id in _escalated_team_ids
+
+
+def escalate_team(project_id: int, team_id: int) -> None:
+    """Send all items of the team through quality check in every workflow and save
+    the escalation in the custom data of the project."""
+
+    def update(data: Dict[str, Any]) -> None:
+        team_ids = set(data.get("escalated_team_ids", [])) | {team_id}
+        data["escalated_team_ids"] = sorted(team_ids)
+
+    with _lock:
+        _escalated_team_ids.add(team_id)
+    update_project_custom_data(
+        project_id, MULTITEAM_LABELING_QUALITY_CHECK_TITLE, update
+    )
+
+
+def get_sample_fraction(team_id: Optional[int]) -> float:
+    """Return the quality check sample fraction of a new queue of the team: all
+    items once the team is escalated."""
+    if is_team_escalated(team_id):
+        return 1.0
+    return g.QUALITY_CHECK_SAMPLE_FRACTION
+
+
+def observe_rejections(
+    project_id: int, step_state: StepState, queue_info: LabelingQueueInfo
+) -> bool:
+    """Update the rejections of the step from the latest queue counters and escalate
+    the quality check of the step's team if the rejection rate exceeds the threshold.
+
+    The rejections are a lower bound (see `QualityCheckStats`), so the escalation
+    may come late but isn't triggered by concurrent annotations. Returns True if the
+    statistics changed and should be saved.
+    """
+    stats = step_state.quality_check
+    team_id = step_state.config.team_id
+    if (
+        stats.escalated
+        or is_team_escalated(team_id)
+        or g.QUALITY_CHECK_SAMPLE_FRACTION >= 1
+    ):
+        return False
+
+    changed = stats.observe(queue_info)
+    reviewed = stats.rejected + get_queue_progress(queue_info)["accepted_count"]
+    if reviewed < MIN_REVIEWED_ITEMS_FOR_ESCALATION:
+        return changed
+
+    rejection_rate = stats.rejected / reviewed
+    if rejection_rate > g.QUALITY_CHECK_ESCALATION_THRESHOLD:
+        sly.logger.warning(
+            f"Rejection rate of team ID {team_id} is at least "
+            f"{rejection_rate:.2%}, exceeding {g.QUALITY_CHECK_ESCALATION_THRESHOLD:.2%}. "
+            "Escalating quality check to all items of the team."
+        )
+        escalate_team(project_id, team_id)
+    return changed
+
+
+def escalate_step(step) -> bool:
+    """Once the step's team is escalated, move the items of the step's queues without
+    quality check that nobody has started yet to a queue with quality check.
+
+    Items can't be added to an existing queue, so, like overflow items, they are
+    moved to a nested dataset of the step with its own queue, and moved back when
+    the step's queues are completed. Returns True if the step was escalated.
+    """
+    stats = step.state.quality_check
+    if stats.escalated or not is_team_escalated(step.config.team_id):
+        return False
+
+    queue_name = step.get_labeling_queue_name()
+    unchecked_queues = [
+        queue_info
+        for queue_info in step.get_auxiliary_queues(NO_QUALITY_CHECK_QUEUE_KIND)
+        if queue_info.status != "completed"
+    ]
+    for index, unchecked_queue in enumerate(unchecked_queues, start=1):
+        pending_ids = get_pending_image_ids(unchecked_queue)
+        if not pending_ids:
+            continue
+        checked_name = (
+            f"{queue_name}{AUXILIARY_QUEUE_SEPARATOR}{ESCALATED_QUEUE_KIND}_{index}"
+        )
+        dataset_info = g.api.dataset.get_or_create(
+            step.project_id, checked_name, parent_id=step.dataset_id
+        )
+        g.api.image.move_batch(dataset_info.id, pending_ids, with_annotations=True)
+        g.api.labeling_queue.create(
+            name=checked_name,
+            user_ids=list(step.config.labeler_ids),
+            reviewer_ids=list(step.config.reviewer_ids),
+            dataset_id=dataset_info.id,
+            classes_to_label=list(step.config.class_names),
+            tags_to_label=list(step.config.tag_names),
+            enable_quality_check=True,
+            quality_check_user_ids=list(step.config.quality_check_ids),
+        )
+        sly.logger.info(
+            f"Step {step.step_number}: {len(pending_ids)} items of "
+            f"{unchecked_queue.name} moved to {checked_name} with quality check."
+        )
+    stats.escalated = True
+    return True
@@ -0,0 +1,123 @@
+from typing import List, Optional
+
+import supervisely as sly
+from supervisely.api.labeling_queue_api import LabelingQueueInfo
+
+import src.globals as g
+from src.utils import AUXILIARY_QUEUE_SEPARATOR, get_queue_backlog
+
+OVERFLOW_QUEUE_KIND = "Overflow"
+MAX_OVERFLOW_QUEUES_PER_STEP = 1
+
+
+def get_overflow_queue_name(main_queue_name: str, index: int) -> str:
+    return f"{main_queue_name}{AUXILIARY_QUEUE_SEPARATOR}{OVERFLOW_QUEUE_KIND}_{index}"
+
+
+def get_pending_image_ids(queue_info: LabelingQueueInfo) -> List[int]:
+    """Return IDs of the queue items nobody has started working on yet."""
+    entities = g.api.labeling_queue.get_entities_all_pages(queue_info.id, status="null")
+    return sorted(entity["id"] for entity in entities["images"])
+
+
+def get_auxiliary_datasets(step) -> List[sly.DatasetInfo]:
+    """Return the nested datasets holding the items of the step's auxiliary queues
+    (overflow queues and queues with escalated quality check)."""
+    prefix = step.get_labeling_queue_name() + AUXILIARY_QUEUE_SEPARATOR
+    return [
+        dataset_info
+        for dataset_info in g.api.dataset.get_list(
+            step.project_id, parent_id=step.dataset_id
+        )
+        if dataset_info.name.startswith(prefix)
+    ]
+
+
+def return_auxiliary_items(step) -> None:
+    """Move the items of the completed auxiliary queues back to the step dataset and
+    remove their datasets, so the next steps get all items of the step."""
+    for dataset_info in get_auxiliary_datasets(step):
+        image_ids = [
+            image_info.id for image_info in g.api.image.get_list(dataset_info.id)
+        ]
+        if image_ids:
+            g.api.image.move_batch(step.dataset_id, image_ids, with_annotations=True)
+        g.api.dataset.remove_batch([dataset_info.id])
+        sly.logger.info(
+            f"Step {step.step_number}: {len(image_ids)} items of {dataset_info.name} "
+            "returned to the step dataset."
+        )
+
+
+def rebalance_step(step, queue_info: LabelingQueueInfo) -> Optional[LabelingQueueInfo]:
+    """Raise throughput of a lagging step by moving part of its backlog to an overflow queue.
+
+    The overflow items are moved out of the main queue's dataset into a nested dataset
+    of the step, so they are labeled only once. The overflow queue is created there for
+    the step's overflow labelers, with the same classes, tags, reviewers and quality
+    check users as the main queue. It gets the tail of the main queue's pending items
+    proportionally to the number of overflow labelers, so the main queue keeps working
+    from its head. The items are moved back when the step's queues are completed.
+    """
+    if g.REBALANCE_BACKLOG_THRESHOLD <= 0:
+        return None
+
+    backlog = get_queue_backlog(queue_info)
+    if backlog is None:
+        sly.logger.warning(
+            f"Step {step.step_number} queue has no progress counters, "
+            "rebalancing is skipped."
+        )
+        return None
+    if backlog <= g.REBALANCE_BACKLOG_THRESHOLD:
+        return None
+
+    labeler_ids = step.config.labeler_ids
+    overflow_ids = [
+        user_id
+        for user_id in step.config.overflow_labeler_ids
+        if user_id not in labeler_ids
+    ]
+    if not overflow_ids:
+        sly.logger.debug(
+            "Step %s backlog is %s, but no overflow labelers are set.",
+            step.step_number,
+            backlog,
+        )
+        return None
+
+    overflow_queues = step.get_auxiliary_queues(OVERFLOW_QUEUE_KIND)
+    if len(overflow_queues) >= MAX_OVERFLOW_QUEUES_PER_STEP:
+        return None
+
+    pending_ids = get_pending_image_ids(queue_info)
+    share = len(overflow_ids) / (len(overflow_ids) + len(labeler_ids))
+    overflow_count = min(int(len(pending_ids) * share), backlog)
+    if overflow_count <= 0:
+        return None
+
+    queue_name = get_overflow_queue_name(
+        step.get_labeling_queue_name(), len(overflow_queues) + 1
+    )
+    sly.logger.info(
+        f"Step {step.step_number} backlog {backlog} exceeds threshold "
+        f"{g.REBALANCE_BACKLOG_THRESHOLD}. Creating overflow queue {queue_name} "
+        f"with {overflow_count} items for {len(overflow_ids)} overflow labelers."
+    )
+    overflow_dataset = g.api.dataset.get_or_create(
+        step.project_id, queue_name, parent_id=step.dataset_id
+    )
+    g.api.image.move_batch(
+        overflow_dataset.id, pending_ids[-overflow_count:], with_annotations=True
+    )
+    queue_id = g.api.labeling_queue.create(
+        name=queue_name,
+        user_ids=overflow_ids,
+        reviewer_ids=list(step.config.reviewer_ids),
+        dataset_id=overflow_dataset.id,
+        classes_to_label=list(step.config.class_names),
+        tags_to_label=list(step.config.tag_names),
+        enable_quality_check=True,
+        quality_check_user_ids=list(step.config.quality_check_ids),
+    )
+    return g.api.labeling_queue.get_info_by_id(queue_id)
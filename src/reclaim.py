@@ -0,0 +1,136 @@
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+import supervisely as sly
+
+import src.globals as g
+from src.api_client import low_priority
+from src.custom_data import update_workflow_state
+from src.state import DatasetState
+
+RECLAIM_BATCH_SIZE = 50
+RECLAIM_WORKERS = 4
+
+_lock = threading.Lock()
+_step_project_locks: Dict[Tuple[int, str], threading.Lock] = defaultdict(threading.Lock)
+
+
+def get_step_project_lock(workspace_id: int, project_name: str) -> threading.Lock:
+    """Return the lock held while a step dataset is created in the step project
+    and while the project is checked and removed as empty."""
+    with _lock:
+        return _step_project_locks[(workspace_id, project_name)]
+
+
+class ReclaimPlan:
+    """Step datasets of a finished workflow to remove, and the projects they're in."""
+
+    def __init__(self, project_id: int, dataset_id: int):
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+        self.dataset_ids: List[int] = []
+        self.step_project_ids: Set[int] = set()
+
+
+def plan_reclaim(
+    project_id: int,
+    dataset_id: int,
+    step_datasets: List[Optional[DatasetState]],
+    keep_last: int,
+) -> ReclaimPlan:
+    """Select the datasets of all steps but the last `keep_last` ones.
+
+    Args:
+        project_id: Source project ID of the workflow.
+        dataset_id: Source dataset ID of the workflow, never removed.
+        step_datasets: Datasets of the steps in the step order, None if not created.
+        keep_last: Number of datasets of the last steps to keep. The last step is
+            always kept when the results are not written back to the source.
+    """
+    if not g.WRITE_BACK_RESULTS:
+        keep_last = max(keep_last, 1)
+    plan = ReclaimPlan(project_id, dataset_id)
+    for dataset_info in step_datasets[: max(len(step_datasets) - keep_last, 0)]:
+        if dataset_info is None or dataset_info.id == dataset_id:
+            continue
+        if dataset_info.project_id == project_id:
+            continue
+        plan.dataset_ids.append(dataset_info.id)
+        plan.step_project_ids.add(dataset_info.project_id)
+    return plan
+
+
+def reclaim_step_datasets(plans: List[ReclaimPlan], dry_run: bool = False) -> int:
+    """Remove the planned datasets of several workflows in parallel batches, then
+    remove the step projects left without datasets.
+
+    Returns:
+        Number of removed (or, in a dry run, removable) datasets.
+    """
+    dataset_ids = [dataset_id for plan in plans for dataset_id in plan.dataset_ids]
+    if not dataset_ids:
+        return 0
+
+    if dry_run:
+        for plan in plans:
+            sly.logger.info(
+                f"Dry run: datasets {plan.dataset_ids} of the workflow of Dataset ID "
+                f"{plan.dataset_id} would be removed."
+            )
+            update_workflow_state(
+                plan.project_id, plan.dataset_id, {"reclaimable": plan.dataset_ids}
+            )
+        return len(dataset_ids)
+
+    batches = [
+        dataset_ids[i : i + RECLAIM_BATCH_SIZE]
+        for i in range(0, len(dataset_ids), RECLAIM_BATCH_SIZE)
+    ]
+    sly.logger.info(
+        f"Removing {len(dataset_ids)} intermediate step datasets of {len(plans)} "
+        f"workflows in {len(batches)} batches."
+    )
+    with ThreadPoolExecutor(max_workers=RECLAIM_WORKERS) as executor:
+        list(executor.map(low_priority(g.api.dataset.remove_batch), batches))
+
+    step_project_ids = set().union(*(plan.step_project_ids for plan in plans))
+    source_project_ids = {plan.project_id for plan in plans}
+    remove_empty_projects(step_project_ids - source_project_ids)
+
+    for plan in plans:
+        update_workflow_state(
+            plan.project_id, plan.dataset_id, {"reclaimed": plan.dataset_ids}
+        )
+    return len(dataset_ids)
+
+
+def remove_empty_projects(project_ids: Set[int]) -> None:
+    """Remove step projects that have no datasets left.
+
+    Each candidate is re-checked under the lock of the step project, so a project
+    another workflow is provisioning a step dataset into is never removed.
+    """
+    with ThreadPoolExecutor(max_workers=RECLAIM_WORKERS) as executor:
+        project_infos: Dict[int, Optional[sly.ProjectInfo]] = dict(
+            zip(
+                project_ids,
+                executor.map(low_priority(g.api.project.get_info_by_id), project_ids),
+            )
+        )
+    candidates = [
+        project_info
+        for project_info in project_infos.values()
+        if project_info is not None and not project_info.datasets_count
+    ]
+    removed = 0
+    for candidate in candidates:
+        with get_step_project_lock(candidate.workspace_id, candidate.name):
+            project_info = g.api.project.get_info_by_id(candidate.id)
+            if project_info is None or project_info.datasets_count:
+                continue
+            g.api.project.remove_batch([project_info.id])
+            removed += 1
+    if removed:
+        sly.logger.info(f"Removed {removed} empty step projects.")
@@ -0,0 +1,326 @@
+"""Record-and-replay harness for deterministic performance regression tests.
+
+Record a real pipeline run by starting the app with `API_RECORD_PATH` set: every
+API call with its arguments, response, error and latency is written to a gzipped
+JSONL file.
+
+Replay it offline against the current code and compare two versions:
+
+    python -m src.replay run recording.jsonl.gz --polls 20 --output new.json
+    python -m src.replay compare old.json new.json
+"""
+
+import argparse
+import atexit
+import gzip
+import inspect
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict, deque, namedtuple
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from src.api_client import ApiWrapper
+
+RECORDING_VERSION = 1
+RECORDED_ENV = (
+    "TEAM_ID",
+    "WORKSPACE_ID",
+    "PROJECT_ID",
+    "DATASET_ID",
+    "context.teamId",
+    "context.workspaceId",
+    "modal.state.slyProjectId",
+    "modal.state.slyDatasetId",
+)
+REPLAY_SERVER_ADDRESS = "http://replay.invalid"
+
+_namedtuple_types: Dict[Tuple[str, Tuple[str, ...]], type] = {}
+
+
+def to_record(value: Any) -> Any:
+    """Convert an API argument or response to a JSON-compatible value."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, tuple) and hasattr(value, "_fields"):
+        return {
+            "__nt__": type(value).__name__,
+            "f": {key: to_record(item) for key, item in value._asdict().items()},
+        }
+    if isinstance(value, (list, tuple, set)):
+        return [to_record(item) for item in value]
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value):
+            return {key: to_record(item) for key, item in value.items()}
+        return {"__d__": [[to_record(k), to_record(v)] for k, v in value.items()]}
+    if hasattr(value, "to_json"):
+        return {"__json__": type(value).__name__, "v": value.to_json()}
+    return {"__repr__": repr(value)}
+
+
+def from_record(value: Any) -> Any:
+    """Restore a value written by `to_record`. Named tuples are restored as named
+    tuples with the same name and fields, other objects as their JSON."""
+    if isinstance(value, list):
+        return [from_record(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if "__nt__" in value:
+        fields = value["f"]
+        key = (value["__nt__"], tuple(fields))
+        if key not in _namedtuple_types:
+            _namedtuple_types[key] = namedtuple(*key)
+        return _namedtuple_types[key](**{k: from_record(v) for k, v in fields.items()})
+    if "__d__" in value:
+        return {from_record(k): from_record(v) for k, v in value["__d__"]}
+    if "__json__" in value:
+        return value["v"]
+    if "__repr__" in value:
+        return value["__repr__"]
+    return {key: from_record(item) for key, item in value.items()}
+
+
+def get_call_key(args: tuple, kwargs: dict) -> str:
+    return json.dumps([to_record(args), to_record(kwargs)], sort_keys=True)
+
+
+class ApiRecorder(ApiWrapper):
+    """Saves every API request/response pair to a gzipped JSONL file."""
+
+    def __init__(self, api, path: str):
+        super().__init__(api)
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._file = gzip.open(path, "wt")
+        context = {
+            "version": RECORDING_VERSION,
+            "started": time.time(),
+            "env": {
+                key: value
+                for key, value in os.environ.items()
+                if key in RECORDED_ENV or key.startswith("modal.state.")
+            },
+        }
+        self._write(context)
+        atexit.register(self.close)
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+    def call(self, path: str, method: Callable, *args, **kwargs) -> Any:
+        record = {"p": path, "k": get_call_key(args, kwargs)}
+        started = time.perf_counter()
+        try:
+            result = method(*args, **kwargs)
+            if inspect.isgenerator(result):
+                result = list(result)
+            record["r"] = to_record(result)
+            return result
+        except Exception as e:
+            record["e"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            record["t"] = round(time.perf_counter() - started, 4)
+            with self._lock:
+                self._seq += 1
+                record["s"] = self._seq
+            self._write(record)
+
+
+def load_recording(path: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    with gzip.open(path, "rt") as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    if not lines or lines[0].get("version") != RECORDING_VERSION:
+        raise ValueError(f"{path} is not a recording of version {RECORDING_VERSION}.")
+    return lines[0], sorted(lines[1:], key=lambda record: record["s"])
+
+
+class ReplayMissError(LookupError):
+    """The replayed call has no recorded response."""
+
+
+class ReplayApi:
+    """Serves recorded responses in place of `g.api`.
+
+    Calls are matched by method path and arguments, repeated calls get the
+    recorded responses in order (the last one is repeated when they run out).
+    Calls without a recorded response raise ReplayMissError and are counted as
+    unmatched (the method was recorded with other arguments) or missing.
+    """
+
+    def __init__(self, records: List[Dict[str, Any]], latency_scale: float = 1.0):
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._responses: Dict[Tuple[str, str], Deque[Dict]] = defaultdict(deque)
+        self._paths = set()
+        for record in records:
+            self._responses[(record["p"], record["k"])].append(record)
+            self._paths.add(record["p"])
+        self.calls: Counter = Counter()
+        self.unmatched: Counter = Counter()
+        self.missing: Counter = Counter()
+
+    def call(self, path: str, args: tuple, kwargs: dict) -> Any:
+        with self._lock:
+            self.calls[path] += 1
+            responses = self._responses.get((path, get_call_key(args, kwargs)))
+            if not responses:
+                if path in self._paths:
+                    self.unmatched[path] += 1
+                    raise ReplayMissError(
+                        f"{path} was not recorded with these arguments."
+                    )
+                self.missing[path] += 1
+                raise ReplayMissError(f"{path} was not recorded.")
+            record = responses.popleft() if len(responses) > 1 else responses[0]
+
+        if self.latency_scale > 0:
+            time.sleep(record["t"] * self.latency_scale)
+        if "e" in record:
+            raise RuntimeError(f"Replayed error of {path}: {record['e']}")
+        return from_record(record.get("r"))
+
+    def __getattr__(self, name: str) -> "_ReplayProxy":
+        return _ReplayProxy(self, name)
+
+
+class _ReplayProxy:
+    def __init__(self, replay_api: ReplayApi, path: str):
+        self._replay_api = replay_api
+        self._path = path
+
+    def __getattr__(self, name: str) -> "_ReplayProxy":
+        return _ReplayProxy(self._replay_api, f"{self._path}.{name}")
+
+    def __call__(self, *args, **kwargs) -> Any:
+        return self._replay_api.call(self._path, args, kwargs)
+
+
+def run_replay(
+    recording_path: str,
+    polls: int = 10,
+    latency_scale: float = 1.0,
+    save: bool = False,
+) -> Dict[str, Any]:
+    """Replay a recording against `Workflow`, `WorkflowMonitor` and `save_workflow`
+    and return API call counts and wall time."""
+    context, records = load_recording(recording_path)
+    os.environ.update(context["env"])
+    os.environ.setdefault("SERVER_ADDRESS", REPLAY_SERVER_ADDRESS)
+    os.environ.setdefault("API_TOKEN", "replay")
+    os.environ.pop("API_RECORD_PATH", None)
+
+    import src.globals as g
+
+    replay_api = ReplayApi(records, latency_scale)
+    g.api = replay_api
+
+    started = time.perf_counter()
+    from src.content import WorkflowMonitor, save_workflow
+
+    startup_time = time.perf_counter() - started
+    startup_calls = sum(replay_api.calls.values())
+
+    if save:
+        save_workflow()
+
+    monitor = WorkflowMonitor()
+    monitor.monitor_selected = True
+    poll_times = []
+    for _ in range(polls):
+        poll_started = time.perf_counter()
+        monitor.update_all()
+        poll_times.append(round(time.perf_counter() - poll_started, 4))
+
+    return {
+        "recording": recording_path,
+        "recorded_calls": len(records),
+        "polls": polls,
+        "latency_scale": latency_scale,
+        "startup_time_s": round(startup_time, 4),
+        "startup_calls": startup_calls,
+        "wall_time_s": round(time.perf_counter() - started, 4),
+        "poll_times_s": poll_times,
+        "api_calls": sum(replay_api.calls.values()),
+        "calls_by_path": dict(replay_api.calls.most_common()),
+        "unmatched_calls": dict(replay_api.unmatched),
+        "missing_calls": dict(replay_api.missing),
+    }
+
+
+def count_misses(report: Dict[str, Any]) -> int:
+    """Return the number of calls of the report that had no recorded response."""
+    return sum(report.get("unmatched_calls", {}).values()) + sum(
+        report.get("missing_calls", {}).values()
+    )
+
+
+def compare_reports(baseline: Dict[str, Any], candidate: Dict[str, Any]) -> str:
+    lines = [
+        f"{'metric':<50}{'baseline':>12}{'candidate':>12}{'delta':>10}",
+    ]
+
+    def add_line(name: str, old: float, new: float) -> None:
+        delta = f"{(new - old) / old:+.1%}" if old else "n/a"
+        lines.append(f"{name:<50}{old:>12}{new:>12}{delta:>10}")
+
+    add_line("wall_time_s", baseline["wall_time_s"], candidate["wall_time_s"])
+    add_line("api_calls", baseline["api_calls"], candidate["api_calls"])
+    add_line("replay_misses", count_misses(baseline), count_misses(candidate))
+    paths = sorted(set(baseline["calls_by_path"]) | set(candidate["calls_by_path"]))
+    for path in paths:
+        add_line(
+            f"  {path}",
+            baseline["calls_by_path"].get(path, 0),
+            candidate["calls_by_path"].get(path, 0),
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Replay a recording.")
+    run_parser.add_argument("recording")
+    run_parser.add_argument("--polls", type=int, default=10)
+    run_parser.add_argument(
+        "--latency-scale",
+        type=float,
+        default=1.0,
+        help="Multiplier of the recorded latencies, 0 to replay without delays.",
+    )
+    run_parser.add_argument(
+        "--save", action="store_true", help="Call save_workflow before polling."
+    )
+    run_parser.add_argument("--output", help="Path to save the JSON report.")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two reports.")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        report = run_replay(args.recording, args.polls, args.latency_scale, args.save)
+        report_json = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(report_json)
+        print(report_json)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.candidate) as f:
+            candidate = json.load(f)
+        print(compare_reports(baseline, candidate))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,577 @@
+"""Capacity simulator of multi-team labeling pipelines.
+
+Estimates how long a dataset takes to go through the configured workflow steps
+and which step and role limit it, before the dataset is committed to the pipeline.
+Inputs are the saved step configurations (teams, users, classes and tags) and the
+throughput measured by the monitor in the finished workflows of the project.
+
+Every step is a tandem of three stations, labelers, reviewers and quality check
+users, each a FIFO queue with one server per user and exponential service times.
+Items rejected on review are labeled and reviewed once more. All runs of a
+scenario are simulated at once on NumPy arrays, so thousands of runs take seconds.
+
+    python -m src.simulator --project-id 1 --dataset-id 2 --items 5000
+    python -m src.simulator --config steps.json --items 5000 --runs 2000
+"""
+
+import argparse
+import json
+import math
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from src.dependencies import get_parallel_stages
+
+ROLES = ("labeler", "reviewer", "quality_check")
+DEFAULT_RUNS = 1000
+DEFAULT_SHARDS = 10
+DEFAULT_QC_FRACTION = 0.2
+# Items per user-hour of the roles without measured throughput.
+DEFAULT_RATES = {"labeler": 20.0, "reviewer": 60.0, "quality_check": 120.0}
+DEFAULT_REJECTION_RATE = 0.05
+# Throughput measured on fewer items is not used.
+MIN_OBSERVED_ITEMS = 20
+
+# How items are handed from a stage to the next one:
+# - sequential: the next stage starts when all items are accepted, as the app does;
+# - sharded: the items are handed over in equal shards, each as soon as it is done;
+# - streaming: every item is handed over as soon as it is accepted.
+HANDOFF_MODES = ("sequential", "sharded", "streaming")
+
+
+class Scenario:
+    def __init__(self, name: str, handoff: str, qc_fraction: Optional[float] = None):
+        self.name = name
+        self.handoff = handoff
+        # Fraction of items that go through quality check, all if None.
+        self.qc_fraction = qc_fraction
+
+
+def get_scenarios(qc_fraction: float = DEFAULT_QC_FRACTION) -> Dict[str, Scenario]:
+    return {
+        "sequential": Scenario("sequential", "sequential"),
+        "streaming": Scenario("streaming", "streaming"),
+        "sharded": Scenario("sharded", "sharded"),
+        "sampled_qc": Scenario("sampled_qc", "sequential", qc_fraction),
+    }
+
+
+class StepModel:
+    """Users and per-user throughput of a workflow step."""
+
+    def __init__(
+        self,
+        step_number: int,
+        servers: Dict[str, int],
+        rates: Dict[str, float],
+        rejection_rate: float,
+        team_id: Optional[int] = None,
+        rates_source: str = "default",
+    ):
+        self.step_number = step_number
+        self.servers = servers
+        self.rates = rates
+        self.rejection_rate = rejection_rate
+        self.team_id = team_id
+        self.rates_source = rates_source
+
+    def get_capacity(self, qc_fraction: float = 1.0) -> Dict[str, float]:
+        """Items per hour every role can handle, counting the rework of rejected items."""
+        passes = 1 / (1 - self.rejection_rate)
+        visits = {"labeler": passes, "reviewer": passes, "quality_check": qc_fraction}
+        return {
+            role: (
+                self.servers[role] * self.rates[role] / visits[role]
+                if self.servers[role] and visits[role]
+                else math.inf
+            )
+            for role in ROLES
+        }
+
+
+def aggregate_throughput(
+    samples: Iterable[Tuple[int, Dict[str, Any]]],
+) -> Dict[Tuple, Counter]:
+    """Sum up the work and user-hours measured in the step queues by team, by step
+    number and over all steps."""
+    totals: Dict[Tuple, Counter] = defaultdict(Counter)
+    for step_number, sample in samples:
+        hours = sample.get("hours") or 0
+        for key in (("team", sample.get("team_id")), ("step", step_number), ("all",)):
+            total = totals[key]
+            for field in ("labeled", "reviewed", "accepted", "rejected"):
+                total[field] += sample.get(field) or 0
+            total["labeler"] += hours * (sample.get("labelers") or 0)
+            total["reviewer"] += hours * (sample.get("reviewers") or 0)
+            total["quality_check"] += hours * (sample.get("quality_check_users") or 0)
+    return totals
+
+
+def get_rates(
+    totals: Dict[Tuple, Counter], team_id: Optional[int], step_number: int
+) -> Tuple[Dict[str, float], float, str]:
+    """Return per-user rates, the rejection rate and where they come from: the same
+    team, the same step of other teams, all steps or the defaults.
+
+    Measured rates are lower bounds: every user of a step is counted as working
+    while its queue was active, including users of roles that weren't the bottleneck
+    and were waiting for work, and rejections hidden by concurrent annotations are
+    not counted.
+    """
+    for key in (("team", team_id), ("step", step_number), ("all",)):
+        total = totals.get(key)
+        if not total or total["labeled"] < MIN_OBSERVED_ITEMS:
+            continue
+        done = {
+            "labeler": total["labeled"],
+            "reviewer": total["reviewed"],
+            # There are no separate counters of quality check, all accepted items
+            # are assumed to be checked.
+            "quality_check": total["accepted"],
+        }
+        rates = {
+            role: (
+                done[role] / total[role]
+                if total[role] and done[role]
+                else DEFAULT_RATES[role]
+            )
+            for role in ROLES
+        }
+        rejection_rate = (
+            total["rejected"] / total["reviewed"]
+            if total["reviewed"]
+            else DEFAULT_REJECTION_RATE
+        )
+        return rates, min(rejection_rate, 0.9), " ".join(map(str, key))
+    return dict(DEFAULT_RATES), DEFAULT_REJECTION_RATE, "default"
+
+
+def build_step_models(
+    configs: Dict[Any, Dict[str, Any]],
+    workflow_states: Dict[str, Dict[str, Any]],
+) -> List[StepModel]:
+    """Create models of the steps from the saved configuration and the throughput
+    saved in the workflow states of the project."""
+    samples = [
+        (int(step_number), sample)
+        for workflow_state in workflow_states.values()
+        for step_number, sample in workflow_state.get("throughput", {}).items()
+    ]
+    totals = aggregate_throughput(samples)
+    models = []
+    for step_number in sorted(configs, key=int):
+        data = configs[step_number]
+        servers = {
+            "labeler": len(data.get("labeler_ids") or []),
+            "reviewer": len(data.get("reviewer_ids") or []),
+            "quality_check": len(data.get("quality_check_ids") or []),
+        }
+        if not servers["labeler"] or not servers["reviewer"]:
+            raise ValueError(f"Step {step_number} has no labelers or reviewers.")
+        rates, rejection_rate, source = get_rates(
+            totals, data.get("team_id"), int(step_number)
+        )
+        models.append(
+            StepModel(
+                int(step_number),
+                servers,
+                rates,
+                rejection_rate,
+                data.get("team_id"),
+                source,
+            )
+        )
+    return models
+
+
+def load_project_pipeline(
+    project_id: int, dataset_id: int
+) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+    """Return the saved step configuration of a dataset and the workflow states of
+    all datasets of the project."""
+    import src.globals as g
+    from src.custom_data import (
+        MULTITEAM_LABELING_WORKFLOW_STATE_TITLE,
+        MULTITEAM_LABELING_WORKFLOW_TITLE,
+    )
+
+    project_custom_data = g.api.project.get_custom_data(project_id)
+    configs = project_custom_data.get(MULTITEAM_LABELING_WORKFLOW_TITLE, {}).get(
+        str(dataset_id)
+    )
+    if not configs:
+        raise ValueError(
+            f"No saved workflow configuration for Dataset ID {dataset_id}."
+        )
+    workflow_states = project_custom_data.get(
+        MULTITEAM_LABELING_WORKFLOW_STATE_TITLE, {}
+    )
+    return configs, workflow_states
+
+
+def simulate_station(
+    arrivals: np.ndarray, service: np.ndarray, servers: int
+) -> np.ndarray:
+    """Return departure times of items going through a FIFO station.
+
+    Args:
+        arrivals: Arrival times (runs, items), non-decreasing along the items.
+        service: Service times (runs, items).
+        servers: Number of users working at the station.
+    """
+    runs, items = arrivals.shape
+    if servers >= items:
+        return arrivals + service
+    if servers == 1:
+        # Lindley recursion d[i] = max(a[i], d[i - 1]) + s[i] in closed form,
+        # summed in double precision not to accumulate rounding errors.
+        done = np.cumsum(service, axis=1, dtype=np.float64)
+        done_before = done - service
+        departures = done + np.maximum.accumulate(arrivals - done_before, axis=1)
+        return departures.astype(arrivals.dtype)
+
+    # Items start in arrival order on the server freed first, so the times the
+    # servers get free are the `servers` latest departures so far. They're kept
+    # sorted in every run, followed by an infinite sentinel: an item starts at the
+    # earliest one, and its departure takes its place in the sorted order with one
+    # clip per item instead of an argmin and a heap.
+    free = np.zeros((servers + 1, runs), dtype=arrivals.dtype)
+    free[servers] = np.inf
+    spare = free.copy()
+    done = np.empty(runs, dtype=arrivals.dtype)
+    departures = np.empty_like(arrivals)
+    for i in range(items):
+        np.maximum(arrivals[:, i], free[0], out=done)
+        done += service[:, i]
+        departures[:, i] = done
+        np.maximum(done, free[:servers], out=spare[:servers])
+        np.minimum(spare[:servers], free[1:], out=spare[:servers])
+        free, spare = spare, free
+    return departures
+
+
+def sample_work(
+    rng: np.random.Generator, passes: np.ndarray, rate: float
+) -> np.ndarray:
+    """Return the time of `passes` exponential services of every item. Only the
+    rejected items get their rework sampled from the gamma distribution."""
+    work = rng.standard_exponential(passes.shape, dtype=np.float32)
+    rework = passes > 1
+    work[rework] += rng.standard_gamma(passes[rework] - 1, dtype=np.float32)
+    work /= rate
+    return work
+
+
+def is_sorted(times: np.ndarray) -> bool:
+    return bool((times[:, 1:] >= times[:, :-1]).all())
+
+
+def simulate_step(
+    model: StepModel,
+    arrivals: np.ndarray,
+    qc_fraction: float,
+    rng: np.random.Generator,
+    keep_order: bool = True,
+) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """Return departure times of the items from the step and the time every role
+    was busy in every run.
+
+    Rework of a rejected item is added to its service times. Every station serves
+    the items in the order they arrive at it, the order in which they left the
+    previous station. Service times are independent between the items, so they're
+    drawn right in that order, only the number of passes follows the items.
+
+    Args:
+        keep_order: Return the departures in the order of the items in `arrivals`.
+            Otherwise they're returned sorted, which is faster: the items are not
+            tracked through the stations.
+    """
+    shape = arrivals.shape
+    # Position of the items in the order of arrival at the next station, None
+    # while it's the order of `arrivals`.
+    order = None
+    times = arrivals
+    if not is_sorted(arrivals):
+        if keep_order:
+            order = np.argsort(arrivals, axis=1)
+            times = np.take_along_axis(arrivals, order, axis=1)
+        else:
+            times = np.sort(arrivals, axis=1)
+    passes = rng.geometric(1 - model.rejection_rate, size=shape).astype(np.int32)
+
+    busy = {}
+    for role in ROLES:
+        if role == "quality_check":
+            if not model.servers[role]:
+                continue
+            checked = rng.random(shape) < qc_fraction
+            service = rng.standard_exponential(shape, dtype=np.float32)
+            service *= checked / np.float32(model.rates[role])
+        else:
+            service = sample_work(rng, passes, model.rates[role])
+        departures = simulate_station(times, service, model.servers[role])
+        busy[role] = service.sum(axis=1)
+        # A single user serves the items in order, and so may several users.
+        if is_sorted(departures):
+            times = departures
+            continue
+        # Only the reviewers need the passes of the items.
+        if not keep_order and role != "labeler":
+            times = np.sort(departures, axis=1)
+            continue
+        departure_order = np.argsort(departures, axis=1)
+        times = np.take_along_axis(departures, departure_order, axis=1)
+        if role == "labeler":
+            passes = np.take_along_axis(passes, departure_order, axis=1)
+        if keep_order:
+            order = (
+                departure_order
+                if order is None
+                else np.take_along_axis(order, departure_order, axis=1)
+            )
+
+    if order is None:
+        return times, busy
+    departures = np.empty_like(times)
+    np.put_along_axis(departures, order, times, axis=1)
+    return departures, busy
+
+
+def hand_off(departures: np.ndarray, handoff: str, shards: int) -> np.ndarray:
+    """Return arrival times of the items at the next stage from their departure
+    times, items keep their order."""
+    if handoff == "streaming":
+        return departures
+    items = departures.shape[1]
+    if handoff == "sharded":
+        # Shards are made of the items in the order they are done.
+        shard_size = math.ceil(items / max(shards, 1))
+        shard_ends = np.minimum(
+            (np.arange(items) // shard_size + 1) * shard_size, items
+        )
+        order = np.argsort(departures, axis=1, kind="stable")
+        sorted_departures = np.take_along_axis(departures, order, axis=1)
+        arrivals = np.empty_like(departures)
+        np.put_along_axis(arrivals, order, sorted_departures[:, shard_ends - 1], axis=1)
+        return arrivals
+    return np.repeat(departures.max(axis=1, keepdims=True), items, axis=1)
+
+
+class SimulationResult:
+    def __init__(
+        self,
+        scenario: Scenario,
+        completion: np.ndarray,
+        utilization: Dict[Tuple[int, str], np.ndarray],
+        step_spans: Dict[int, np.ndarray],
+        elapsed: float,
+    ):
+        self.scenario = scenario
+        self.completion = completion
+        self.utilization = utilization
+        self.step_spans = step_spans
+        self.elapsed = elapsed
+
+    def get_bottleneck(self) -> Tuple[int, str, float]:
+        """Return the step, the role and the mean utilization of the busiest station."""
+        (step_number, role), utilization = max(
+            self.utilization.items(), key=lambda item: item[1].mean()
+        )
+        return step_number, role, float(utilization.mean())
+
+    def to_json(self) -> Dict[str, Any]:
+        step_number, role, utilization = self.get_bottleneck()
+        return {
+            "scenario": self.scenario.name,
+            "handoff": self.scenario.handoff,
+            "qc_fraction": self.scenario.qc_fraction,
+            "runs": len(self.completion),
+            "completion_hours": {
+                "mean": round(float(self.completion.mean()), 2),
+                "p10": round(float(np.percentile(self.completion, 10)), 2),
+                "p50": round(float(np.percentile(self.completion, 50)), 2),
+                "p90": round(float(np.percentile(self.completion, 90)), 2),
+            },
+            "step_hours": {
+                str(number): round(float(spans.mean()), 2)
+                for number, spans in self.step_spans.items()
+            },
+            "bottleneck": {
+                "step": step_number,
+                "role": role,
+                "utilization": round(utilization, 3),
+            },
+            "elapsed_s": round(self.elapsed, 3),
+        }
+
+    def to_text(self) -> str:
+        data = self.to_json()
+        completion = data["completion_hours"]
+        bottleneck = data["bottleneck"]
+        return (
+            f"{self.scenario.name:<12} p50 {completion['p50']:>9.1f} h   "
+            f"p90 {completion['p90']:>9.1f} h   bottleneck: step "
+            f"{bottleneck['step']} {bottleneck['role']} "
+            f"({bottleneck['utilization']:.0%} busy)"
+        )
+
+
+def simulate(
+    models: List[StepModel],
+    stages: List[List[int]],
+    items: int,
+    scenario: Scenario,
+    runs: int = DEFAULT_RUNS,
+    shards: int = DEFAULT_SHARDS,
+    seed: Optional[int] = None,
+) -> SimulationResult:
+    """Simulate `runs` runs of the pipeline on a dataset of `items` items.
+
+    Steps of a stage run in parallel on copies of the dataset, an item leaves the
+    stage when all of its steps are done with it.
+    """
+    if items < 1:
+        raise ValueError("The dataset must have at least one item.")
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    models_by_step = {model.step_number: model for model in models}
+    qc_fraction = 1.0 if scenario.qc_fraction is None else scenario.qc_fraction
+
+    # Hours in single precision are ample for the estimates and halve the memory
+    # traffic of the simulation.
+    arrivals = np.zeros((runs, items), dtype=np.float32)
+    busy: Dict[Tuple[int, str], np.ndarray] = {}
+    step_spans: Dict[int, np.ndarray] = {}
+    for stage in stages:
+        stage_departures = None
+        for step_number in stage:
+            model = models_by_step[step_number]
+            # Items are told apart only to join the departures of parallel steps.
+            departures, step_busy = simulate_step(
+                model, arrivals, qc_fraction, rng, keep_order=len(stage) > 1
+            )
+            step_spans[step_number] = departures.max(axis=1) - arrivals.min(axis=1)
+            for role, role_busy in step_busy.items():
+                busy[(step_number, role)] = role_busy / model.servers[role]
+            stage_departures = (
+                departures
+                if stage_departures is None
+                else np.maximum(stage_departures, departures)
+            )
+        arrivals = hand_off(stage_departures, scenario.handoff, shards)
+
+    completion = stage_departures.max(axis=1)
+    utilization = {key: role_busy / completion for key, role_busy in busy.items()}
+    return SimulationResult(
+        scenario, completion, utilization, step_spans, time.perf_counter() - started
+    )
+
+
+def get_stages(configs: Dict[Any, Dict[str, Any]], parallel: bool) -> List[List[int]]:
+    if parallel:
+        return get_parallel_stages(configs)
+    return [[int(step_number)] for step_number in sorted(configs, key=int)]
+
+
+def format_models(models: List[StepModel], qc_fraction: float = 1.0) -> str:
+    lines = [
+        f"{'step':<6}{'team':>8}{'users L/R/QC':>14}{'items/user-hour L/R/QC':>26}"
+        f"{'rejected':>10}{'items/hour':>12}  rates from"
+    ]
+    footer = []
+    for model in models:
+        servers = "/".join(str(model.servers[role]) for role in ROLES)
+        rates = "/".join(f"{model.rates[role]:.1f}" for role in ROLES)
+        capacity = min(model.get_capacity(qc_fraction).values())
+        lines.append(
+            f"{model.step_number:<6}{str(model.team_id):>8}{servers:>14}{rates:>26}"
+            f"{model.rejection_rate:>10.1%}{capacity:>12.1f}  {model.rates_source}"
+        )
+        if model.rates_source != "default" and not footer:
+            footer.append(
+                "Measured rates are lower bounds: all users of a step are counted "
+                "as working while its queue was active. Measured rejection rates "
+                "are lower bounds too."
+            )
+    return "\n".join(lines + footer)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument(
+        "--project-id", type=int, help="Project with the saved configuration."
+    )
+    source.add_argument(
+        "--config", help="JSON file with step configurations in the saved format."
+    )
+    parser.add_argument("--dataset-id", type=int)
+    parser.add_argument(
+        "--history",
+        help="JSON file with workflow states to take the throughput from, "
+        "used with --config.",
+    )
+    parser.add_argument("--items", type=int, required=True, help="Dataset size.")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    parser.add_argument(
+        "--scenarios", nargs="+", choices=list(get_scenarios()), default=None
+    )
+    parser.add_argument("--shards", type=int, default=DEFAULT_SHARDS)
+    parser.add_argument("--qc-fraction", type=float, default=DEFAULT_QC_FRACTION)
+    parser.add_argument(
+        "--parallel",
+        action="store_true",
+        help="Run steps with different classes and tags in parallel.",
+    )
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", help="Path to save the JSON report.")
+    args = parser.parse_args(argv)
+    if args.items < 1:
+        parser.error("--items must be at least 1.")
+    if args.runs < 1:
+        parser.error("--runs must be at least 1.")
+
+    if args.config:
+        with open(args.config) as f:
+            configs = json.load(f)
+        workflow_states = {}
+        if args.history:
+            with open(args.history) as f:
+                workflow_states = json.load(f)
+    else:
+        if not args.dataset_id:
+            parser.error("--dataset-id is required with --project-id.")
+        configs, workflow_states = load_project_pipeline(
+            args.project_id, args.dataset_id
+        )
+
+    models = build_step_models(configs, workflow_states)
+    stages = get_stages(configs, args.parallel)
+    scenarios = get_scenarios(args.qc_fraction)
+    print(format_models(models))
+    print(f"\n{args.items} items, {args.runs} runs, stages {stages}\n")
+
+    results = []
+    for name in args.scenarios or scenarios:
+        result = simulate(
+            models,
+            stages,
+            args.items,
+            scenarios[name],
+            args.runs,
+            args.shards,
+            args.seed,
+        )
+        results.append(result)
+        print(result.to_text())
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump([result.to_json() for result in results], f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
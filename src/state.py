@@ -0,0 +1,361 @@
+"""Compact in-memory state of workflows, decoupled from the UI widgets.
+
+Monitoring and orchestration read step configurations and poll results only from
+these records, so a process can hold thousands of workflows: records have slots
+and keep IDs, names, statuses and progress counters instead of API infos.
+"""
+
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import supervisely as sly
+from supervisely.api.labeling_queue_api import LabelingQueueInfo
+
+from src.utils import QUEUE_PROGRESS_FIELDS
+
+# Longest time between two changes of a queue's counters counted as work, longer
+# gaps are idle time.
+ACTIVE_INTERVAL_LIMIT = 15 * 60
+
+
+class DatasetState:
+    __slots__ = ("id", "project_id", "name", "items_count", "updated_at")
+
+    def __init__(
+        self,
+        id: int,
+        project_id: int,
+        name: str,
+        items_count: int,
+        updated_at: str,
+    ):
+        self.id = id
+        self.project_id = project_id
+        self.name = name
+        self.items_count = items_count
+        self.updated_at = updated_at
+
+    @classmethod
+    def from_info(
+        cls, dataset_info: Optional[sly.DatasetInfo]
+    ) -> Optional["DatasetState"]:
+        if dataset_info is None:
+            return None
+        return cls(
+            dataset_info.id,
+            dataset_info.project_id,
+            dataset_info.name,
+            dataset_info.items_count,
+            dataset_info.updated_at,
+        )
+
+
+class QueueState:
+    """Labeling queue status and progress counters, with the same attribute names
+    as `LabelingQueueInfo`."""
+
+    __slots__ = ("id", "name", "status", "created_at") + QUEUE_PROGRESS_FIELDS
+
+    def __init__(self, id: int, name: str, status: str, created_at: str, **progress):
+        self.id = id
+        self.name = name
+        self.status = status
+        self.created_at = created_at
+        for field in QUEUE_PROGRESS_FIELDS:
+            setattr(self, field, progress.get(field) or 0)
+
+    @classmethod
+    def from_info(
+        cls, queue_info: Optional[LabelingQueueInfo]
+    ) -> Optional["QueueState"]:
+        if queue_info is None:
+            return None
+        return cls(
+            queue_info.id,
+            queue_info.name,
+            queue_info.status,
+            queue_info.created_at,
+            **{
+                field: getattr(queue_info, field, None)
+                for field in QUEUE_PROGRESS_FIELDS
+            },
+        )
+
+
+class StepConfig:
+    """Team, users, classes and tags of a workflow step."""
+
+    __slots__ = (
+        "team_id",
+        "workspace_id",
+        "class_names",
+        "tag_names",
+        "labeler_ids",
+        "reviewer_ids",
+        "quality_check_ids",
+        "overflow_labeler_ids",
+    )
+
+    def __init__(
+        self,
+        team_id: Optional[int] = None,
+        workspace_id: Optional[int] = None,
+        class_names: Tuple[str, ...] = (),
+        tag_names: Tuple[str, ...] = (),
+        labeler_ids: Tuple[int, ...] = (),
+        reviewer_ids: Tuple[int, ...] = (),
+        quality_check_ids: Tuple[int, ...] = (),
+        overflow_labeler_ids: Tuple[int, ...] = (),
+    ):
+        self.team_id = team_id
+        self.workspace_id = workspace_id
+        self.class_names = class_names
+        self.tag_names = tag_names
+        self.labeler_ids = labeler_ids
+        self.reviewer_ids = reviewer_ids
+        self.quality_check_ids = quality_check_ids
+        self.overflow_labeler_ids = overflow_labeler_ids
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "StepConfig":
+        """Create from a step of the saved workflow configuration."""
+        return cls(
+            team_id=data.get("team_id"),
+            workspace_id=data.get("workspace_id"),
+            class_names=tuple(
+                cls_json["title"] for cls_json in data.get("selected_classes", [])
+            ),
+            tag_names=tuple(
+                tag_json["name"] for tag_json in data.get("selected_tags", [])
+            ),
+            labeler_ids=tuple(data.get("labeler_ids") or ()),
+            reviewer_ids=tuple(data.get("reviewer_ids") or ()),
+            quality_check_ids=tuple(data.get("quality_check_ids") or ()),
+            overflow_labeler_ids=tuple(data.get("overflow_labeler_ids") or ()),
+        )
+
+
+class StepPoll:
+    """Result of the last poll of a workflow step."""
+
+    __slots__ = ("dataset", "queue", "status", "fingerprint")
+
+    def __init__(
+        self,
+        dataset: Optional[DatasetState],
+        queue: Optional[QueueState],
+        status: str,
+        fingerprint: Tuple,
+    ):
+        self.dataset = dataset
+        self.queue = queue
+        self.status = status
+        self.fingerprint = fingerprint
+
+
+class StepThroughput:
+    """Work done in the labeling queue of a step while it was monitored.
+
+    Items rejected on review or quality check are returned to the labelers, so a
+    drop of the annotated counter between polls is counted as rejections, and
+    rejected items are counted as labeled and reviewed once more. Items annotated
+    between the same polls hide rejections, so the work done is a lower bound.
+
+    Only the time the queue was active counts: the time between two changes of its
+    counters, up to ACTIVE_INTERVAL_LIMIT, so nights and weekends aren't charged.
+    """
+
+    __slots__ = (
+        "queue_id",
+        "started_at",
+        "updated_at",
+        "active_seconds",
+        "start_annotated",
+        "start_accepted",
+        "annotated",
+        "accepted",
+        "rejected",
+    )
+
+    def __init__(self):
+        self.queue_id: Optional[int] = None
+        self.started_at: Optional[float] = None
+        self.updated_at: Optional[float] = None
+        self.active_seconds = 0.0
+        self.start_annotated = self.start_accepted = 0
+        self.annotated = self.accepted = self.rejected = 0
+
+    def observe(self, queue: QueueState, now: float) -> None:
+        if queue.id != self.queue_id:
+            self.__init__()
+            self.queue_id = queue.id
+            self.started_at = now
+            self.start_annotated = self.annotated = queue.annotated_count
+            self.start_accepted = self.accepted = queue.accepted_count
+            return
+        if (queue.annotated_count, queue.accepted_count) == (
+            self.annotated,
+            self.accepted,
+        ):
+            return
+        changed_at = self.updated_at or self.started_at
+        self.active_seconds += min(now - changed_at, ACTIVE_INTERVAL_LIMIT)
+        self.rejected += max(self.annotated - queue.annotated_count, 0)
+        self.annotated = queue.annotated_count
+        self.accepted = queue.accepted_count
+        self.updated_at = now
+
+    def to_json(self, config: StepConfig) -> Optional[Dict[str, Any]]:
+        """Return the work done and the active hours it took, None if no work was
+        observed. All users of the step are counted as working while it was active,
+        so rates derived from it are lower bounds."""
+        if self.updated_at is None:
+            return None
+        return {
+            "team_id": config.team_id,
+            "labelers": len(config.labeler_ids),
+            "reviewers": len(config.reviewer_ids),
+            "quality_check_users": len(config.quality_check_ids),
+            "hours": round(self.active_seconds / 3600, 4),
+            "wall_hours": round((self.updated_at - self.started_at) / 3600, 4),
+            "labeled": self.annotated - self.start_annotated + self.rejected,
+            "reviewed": self.accepted - self.start_accepted + self.rejected,
+            "accepted": self.accepted - self.start_accepted,
+            "rejected": self.rejected,
+        }
+
+
+class QualityCheckStats:
+    """Rejections observed in the labeling queue of a step, which decide whether the
+    step's team gets a full quality check.
+
+    Items rejected on review or quality check are returned to the labelers, so a
+    drop of the annotated counter between polls is counted as rejections. Items
+    annotated between the same polls hide rejections, so the count is a lower bound.
+    """
+
+    __slots__ = ("queue_id", "last_annotated", "rejected", "escalated")
+
+    def __init__(self):
+        self.queue_id: Optional[int] = None
+        self.last_annotated = 0
+        self.rejected = 0
+        self.escalated = False
+
+    def observe(self, queue: QueueState) -> bool:
+        """Update the rejections from the latest queue counters, return True if the
+        count changed."""
+        annotated = queue.annotated_count or 0
+        if queue.id != self.queue_id:
+            self.queue_id = queue.id
+            self.last_annotated = annotated
+            self.rejected = 0
+            return False
+        dropped = max(self.last_annotated - annotated, 0)
+        self.last_annotated = annotated
+        self.rejected += dropped
+        return dropped > 0
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "queue_id": self.queue_id,
+            "last_annotated": self.last_annotated,
+            "rejected": self.rejected,
+            "escalated": self.escalated,
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "QualityCheckStats":
+        stats = cls()
+        stats.queue_id = data.get("queue_id")
+        stats.last_annotated = data.get("last_annotated", 0)
+        stats.rejected = data.get("rejected", 0)
+        stats.escalated = data.get("escalated", False)
+        return stats
+
+
+class StepState:
+    """Configuration of a step, its resolved project and dataset, its last poll, and
+    the throughput and quality check rejections measured in its labeling queue.
+
+    `provisioned` is set once the step's project meta and dataset were created at
+    launch, so the transition to the step doesn't look them up again.
+    """
+
+    __slots__ = (
+        "config",
+        "project_id",
+        "dataset_id",
+        "items_count",
+        "provisioned",
+        "poll",
+        "throughput",
+        "quality_check",
+    )
+
+    def __init__(self, config: Optional[StepConfig] = None):
+        self.config = config or StepConfig()
+        self.project_id: Optional[int] = None
+        self.dataset_id: Optional[int] = None
+        self.items_count: Optional[int] = None
+        self.provisioned = False
+        self.poll: Optional[StepPoll] = None
+        self.throughput = StepThroughput()
+        self.quality_check = QualityCheckStats()
+
+
+class WorkflowState:
+    """State of all steps of a workflow and its progress.
+
+    `meta` has the classes and tags of all steps, steps refer to them by name.
+    Workflows launched with the same configuration share it.
+    """
+
+    __slots__ = (
+        "steps",
+        "meta",
+        "stages",
+        "merged_stages",
+        "snapshot",
+        "deltas",
+        "finalized",
+        "reclaimed",
+    )
+
+    def __init__(self):
+        self.steps: Dict[int, StepState] = {}
+        self.meta = sly.ProjectMeta()
+        self.stages: List[List[int]] = []
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget the progress, keep the configuration."""
+        self.merged_stages: Set[Tuple[int, ...]] = set()
+        # Source annotations being saved and step deltas being computed on
+        # background workers.
+        self.snapshot: Optional[Future] = None
+        self.deltas: Optional[Future] = None
+        self.finalized = False
+        self.reclaimed = False
+        self.reset_polls()
+        for step_state in self.steps.values():
+            step_state.provisioned = False
+            step_state.throughput = StepThroughput()
+            step_state.quality_check = QualityCheckStats()
+
+    def reset_polls(self) -> None:
+        for step_state in self.steps.values():
+            step_state.poll = None
+
+
+def get_configs_meta(configs: Dict[Any, Dict[str, Any]]) -> sly.ProjectMeta:
+    """Return a meta with the classes and tags of all steps of a configuration."""
+    meta = sly.ProjectMeta()
+    for data in configs.values():
+        for cls_json in data.get("selected_classes", []):
+            if not meta.get_obj_class(cls_json["title"]):
+                meta = meta.add_obj_class(sly.ObjClass.from_json(cls_json))
+        for tag_json in data.get("selected_tags", []):
+            if not meta.get_tag_meta(tag_json["name"]):
+                meta = meta.add_tag_meta(sly.TagMeta.from_json(tag_json))
+    return meta
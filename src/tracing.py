@@ -0,0 +1,174 @@
+import cProfile
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from typing import Any, Callable, Dict, Optional
+
+import supervisely as sly
+from supervisely.app.singleton import Singleton
+
+import src.globals as g
+
+TRACE_FILE_NAME = "traces.jsonl"
+TRACE_FILE_MAX_BYTES = 10 * 1024 * 1024
+TRACE_FILE_BACKUP_COUNT = 3
+PROFILE_STATS_LIMIT = 50
+
+_local = threading.local()
+_trace_logger: Optional[logging.Logger] = None
+_trace_logger_lock = threading.Lock()
+
+
+def _get_trace_logger() -> logging.Logger:
+    """Logger that writes one JSON span per line to a rotating local file."""
+    global _trace_logger
+    with _trace_logger_lock:
+        if _trace_logger is None:
+            os.makedirs(g.TRACE_DIR, exist_ok=True)
+            handler = RotatingFileHandler(
+                os.path.join(g.TRACE_DIR, TRACE_FILE_NAME),
+                maxBytes=TRACE_FILE_MAX_BYTES,
+                backupCount=TRACE_FILE_BACKUP_COUNT,
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger = logging.getLogger("multi_team_labeling_workflow.traces")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(handler)
+            _trace_logger = logger
+    return _trace_logger
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Measure a block of code and write it as a trace span.
+
+    Spans opened inside the block become its children, so a poll can be
+    followed down to the individual API-heavy operations.
+    """
+    if not g.TRACING_ENABLED:
+        yield
+        return
+
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    parent = stack[-1] if stack else None
+    record: Dict[str, Any] = {
+        "name": name,
+        "trace_id": parent["trace_id"] if parent else uuid.uuid4().hex[:16],
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_id": parent["span_id"] if parent else None,
+        "thread": threading.current_thread().name,
+        "start": time.time(),
+        "attrs": attrs,
+    }
+    stack.append(record)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        record["error"] = repr(e)
+        raise
+    finally:
+        record["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        stack.pop()
+        _get_trace_logger().info(json.dumps(record, default=str))
+
+
+def traced(name: str, get_attrs: Optional[Callable[..., Dict[str, Any]]] = None):
+    """Decorator that wraps every call of the function in a trace span.
+
+    Args:
+        name: Span name.
+        get_attrs: Called with the function arguments, returns span attributes.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            attrs = {}
+            if g.TRACING_ENABLED and get_attrs:
+                attrs = get_attrs(*args, **kwargs)
+            with span(name, **attrs):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class PollProfiler(metaclass=Singleton):
+    """On-demand cProfile capture of the monitoring thread.
+
+    Profiles every `every`-th poll until `polls` polls are captured, then writes
+    the stats (binary and a text summary by cumulative time) next to the traces.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profile: Optional[cProfile.Profile] = None
+        self._remaining = 0
+        self._every = 1
+        self._poll_counter = 0
+        self.last_report_path: Optional[str] = None
+
+    def request(self, polls: int, every: int = 1) -> None:
+        with self._lock:
+            self._profile = cProfile.Profile()
+            self._remaining = max(polls, 0)
+            self._every = max(every, 1)
+            self._poll_counter = 0
+        sly.logger.info(f"Profiling {polls} monitoring polls (every {every}).")
+
+    @property
+    def active(self) -> bool:
+        return self._remaining > 0
+
+    @contextmanager
+    def poll(self):
+        """Wrap a single monitoring poll."""
+        with self._lock:
+            profile = self._profile if self._remaining > 0 else None
+            if profile is not None:
+                self._poll_counter += 1
+                if (self._poll_counter - 1) % self._every:
+                    profile = None
+
+        if profile is None:
+            yield
+            return
+
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self._lock:
+                self._remaining -= 1
+                finished = self._remaining == 0
+            if finished:
+                self._dump(profile)
+
+    def _dump(self, profile: cProfile.Profile) -> None:
+        os.makedirs(g.TRACE_DIR, exist_ok=True)
+        base_path = os.path.join(
+            g.TRACE_DIR, f"profile_{time.strftime('%Y%m%d_%H%M%S')}"
+        )
+        profile.dump_stats(f"{base_path}.prof")
+        summary = io.StringIO()
+        pstats.Stats(profile, stream=summary).sort_stats("cumulative").print_stats(
+            PROFILE_STATS_LIMIT
+        )
+        with open(f"{base_path}.txt", "w") as f:
+            f.write(summary.getvalue())
+        self.last_report_path = f"{base_path}.txt"
+        sly.logger.info(f"Monitoring profile saved to {base_path}.prof")
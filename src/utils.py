@@ -0,0 +1,62 @@
+from typing import Dict, Optional, Tuple
+
+import supervisely as sly
+from supervisely.api.labeling_queue_api import LabelingQueueInfo
+
+# Auxiliary queues (e.g. overflow queues) are named after the step's main queue
+# followed by this separator, so they never match the main queue lookup.
+AUXILIARY_QUEUE_SEPARATOR = "__"
+
+QUEUE_PROGRESS_FIELDS = (
+    "entities_count",
+    "annotated_count",
+    "accepted_count",
+    "in_progress_count",
+    "pending_count",
+)
+
+
+def get_queue_progress(queue_info: LabelingQueueInfo) -> Dict[str, int]:
+    """Return the progress counters of a labeling queue, missing ones as 0."""
+    return {
+        field: getattr(queue_info, field, None) or 0 for field in QUEUE_PROGRESS_FIELDS
+    }
+
+
+def get_queue_backlog(queue_info: LabelingQueueInfo) -> Optional[int]:
+    """Return the number of queue items nobody has started working on yet, or None
+    if the queue doesn't report the counters it is computed from."""
+    if any(
+        getattr(queue_info, field, None) is None
+        for field in ("entities_count", "annotated_count", "in_progress_count")
+    ):
+        return None
+    progress = get_queue_progress(queue_info)
+    return max(
+        progress["entities_count"]
+        - progress["annotated_count"]
+        - progress["in_progress_count"],
+        0,
+    )
+
+
+def is_auxiliary_queue_name(queue_name: str) -> bool:
+    return AUXILIARY_QUEUE_SEPARATOR in queue_name
+
+
+def get_step_fingerprint(
+    dataset_info: Optional[sly.DatasetInfo], queue_info: Optional[LabelingQueueInfo]
+) -> Tuple:
+    """Return a lightweight fingerprint of a workflow step that changes whenever
+    its queue status, queue progress or dataset contents change."""
+    dataset_part = (
+        (dataset_info.id, dataset_info.updated_at, dataset_info.items_count)
+        if dataset_info
+        else None
+    )
+    queue_part = (
+        (queue_info.id, queue_info.status, *get_queue_progress(queue_info).values())
+        if queue_info
+        else None
+    )
+    return dataset_part, queue_part
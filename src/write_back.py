@@ -0,0 +1,86 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import supervisely as sly
+
+import src.globals as g
+from src.api_client import low_priority
+
+WRITE_BACK_BATCH_SIZE = 100
+WRITE_BACK_WORKERS = 4
+
+
+class ItemIndex:
+    """Index of dataset items by name with a fallback by image hash."""
+
+    def __init__(self, image_infos: List[sly.ImageInfo]):
+        self.by_name: Dict[str, int] = {}
+        self.by_hash: Dict[str, Optional[int]] = {}
+        for image_info in image_infos:
+            self.by_name[image_info.name] = image_info.id
+            if image_info.hash:
+                # Ambiguous hashes (duplicate images) can't be used for matching.
+                if image_info.hash in self.by_hash:
+                    self.by_hash[image_info.hash] = None
+                else:
+                    self.by_hash[image_info.hash] = image_info.id
+
+    def match(self, image_info: sly.ImageInfo) -> Optional[int]:
+        image_id = self.by_name.get(image_info.name)
+        if image_id is None and image_info.hash:
+            image_id = self.by_hash.get(image_info.hash)
+        return image_id
+
+
+def write_back_annotations(
+    result_project_id: int,
+    result_dataset_id: int,
+    source_project_id: int,
+    source_dataset_id: int,
+) -> int:
+    """Stream annotations of the last step's dataset back to the source dataset.
+
+    Items are matched by name, or by hash when renamed. Annotations are downloaded
+    and uploaded in batches, several batches at a time.
+
+    Returns:
+        Number of items written back.
+    """
+    result_meta = sly.ProjectMeta.from_json(g.api.project.get_meta(result_project_id))
+    source_meta = sly.ProjectMeta.from_json(g.api.project.get_meta(source_project_id))
+    source_meta = source_meta.merge(result_meta)
+    g.api.project.update_meta(source_project_id, source_meta.to_json())
+
+    index = ItemIndex(g.api.image.get_list(source_dataset_id))
+    pairs: List[Tuple[int, int]] = []
+    for image_info in g.api.image.get_list(result_dataset_id):
+        source_id = index.match(image_info)
+        if source_id is None:
+            sly.logger.warning(
+                f"Item {image_info.name} is not found in the source dataset, skipping."
+            )
+            continue
+        pairs.append((image_info.id, source_id))
+
+    batches = [
+        pairs[i : i + WRITE_BACK_BATCH_SIZE]
+        for i in range(0, len(pairs), WRITE_BACK_BATCH_SIZE)
+    ]
+    sly.logger.info(
+        f"Writing back {len(pairs)} annotations from Dataset ID {result_dataset_id} "
+        f"to Dataset ID {source_dataset_id} in {len(batches)} batches."
+    )
+
+    def write_back_batch(batch: List[Tuple[int, int]]) -> None:
+        result_ids = [result_id for result_id, _ in batch]
+        source_ids = [source_id for _, source_id in batch]
+        ann_jsons = g.api.annotation.download_json_batch(result_dataset_id, result_ids)
+        anns = [
+            sly.Annotation.from_json(ann_json, source_meta) for ann_json in ann_jsons
+        ]
+        g.api.annotation.upload_anns(source_ids, anns)
+
+    with ThreadPoolExecutor(max_workers=WRITE_BACK_WORKERS) as executor:
+        list(executor.map(low_priority(write_back_batch), batches))
+
+    return len(pairs)